@@ -0,0 +1,238 @@
+from collections import Counter
+
+from django.conf.urls import url
+from django.contrib import admin
+from django.http import Http404
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils.html import format_html
+
+from celery import group
+from celery.result import GroupResult
+
+from . import tasks
+from .batching import CREATABLE, NOT_COALESCED
+from .payloads import FINAL_STATUSES
+from .models import (
+    CREATED, VALIDATION_ASKED, MangoPayUser, MangoPayNaturalUser, MangoPayLegalUser, MangoPayDocument, MangoPayPage,
+    MangoPayBankAccount, MangoPayWallet, MangoPayPayIn, MangoPayPayOut, MangoPayPayOutBatchItem, MangoPayCard,
+    MangoPayCardRegistration, MangoPayInRefund, MangoPayTransfer, MangoPayImportCheckpoint, MangoPayTransactionPayload,
+    MangoPayOutboxEntry, MangoPayStatusEvent
+)
+
+class MangoPayAdmin(admin.ModelAdmin):
+    """
+    Admin actions enqueue the chunked tasks for the selected objects instead
+    of calling the API within the request. The results of the tasks are
+    followed on a progress page, which needs a Celery result backend.
+    """
+    chunk_size = 100
+    create_task = None
+    progress_template = "admin/mangopay2/progress.html"
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        urls = [
+            url(r"^progress/(?P<group_id>[\w-]+)/$", self.admin_site.admin_view(self.progress_view),
+                name="%s_%s_progress" % info),
+        ]
+        return urls + super(MangoPayAdmin, self).get_urls()
+
+    def enqueue(self, request, queryset, task):
+        chunks = list(tasks.chunk_queryset(queryset, self.chunk_size))
+        if not chunks:
+            self.message_user(request, "Nothing to do for the selected objects.")
+            return
+        result = group(task.s(ids) for ids in chunks).apply_async()
+        result.save()
+        info = self.model._meta.app_label, self.model._meta.model_name
+        progress_url = reverse("admin:%s_%s_progress" % info, args=(result.id,), current_app=self.admin_site.name)
+        self.message_user(request, format_html(
+            'Queued {} objects in {} chunks. <a href="{}">Follow the progress</a>.',
+            sum(len(ids) for ids in chunks), len(chunks), progress_url))
+
+    def create_remotely(self, request, queryset):
+        self.enqueue(request, queryset.filter(mangopay_id__isnull=True), self.create_task)
+    create_remotely.short_description = "Create the selected objects on MangoPay"
+
+    def progress_view(self, request, group_id):
+        result = GroupResult.restore(group_id)
+        if result is None:
+            raise Http404("Unknown task group")
+        outcomes = Counter()
+        bytes_saved = 0
+        for chunk in result.results:
+            if chunk.successful() and isinstance(chunk.result, dict):
+                chunk_outcomes = dict(chunk.result)
+                bytes_saved += chunk_outcomes.pop(tasks.CHUNK_BYTES_SAVED, 0)
+                outcomes.update(chunk_outcomes.values())
+        context = dict(
+            self.admin_site.each_context(request),
+            title="Progress",
+            opts=self.model._meta,
+            total=len(result.results),
+            completed=result.completed_count(),
+            failed=sum(1 for chunk in result.results if chunk.failed()),
+            outcomes=sorted(outcomes.items()),
+            bytes_saved=bytes_saved,
+        )
+        return TemplateResponse(request, self.progress_template, context)
+
+
+class MangoPayUserAdmin(MangoPayAdmin):
+    list_display = ("id", "mangopay_id", "user", "first_name", "last_name", "email")
+    list_select_related = ("user",)
+    search_fields = ("mangopay_id", "user__email", "email")
+    create_task = tasks.create_mangopay_users_chunk
+    actions = ["create_remotely"]
+
+
+@admin.register(MangoPayDocument)
+class MangoPayDocumentAdmin(MangoPayAdmin):
+    list_display = ("id", "mangopay_id", "mangopay_user", "type", "status")
+    list_select_related = ("mangopay_user__user",)
+    list_filter = ("status", "type")
+    search_fields = ("mangopay_id",)
+    create_task = tasks.create_mangopay_documents_chunk
+    actions = ["create_remotely", "refresh_status", "ask_for_validation"]
+
+    def refresh_status(self, request, queryset):
+        self.enqueue(request, queryset.filter(mangopay_id__isnull=False, status=VALIDATION_ASKED),
+                     tasks.update_documents_status_chunk)
+    refresh_status.short_description = "Refresh the status of the selected documents"
+
+    def ask_for_validation(self, request, queryset):
+        self.enqueue(request, queryset.filter(mangopay_id__isnull=False, status=CREATED),
+                     tasks.ask_for_documents_validation_chunk)
+    ask_for_validation.short_description = "Ask for the validation of the selected documents"
+
+
+@admin.register(MangoPayPage)
+class MangoPayPageAdmin(admin.ModelAdmin):
+    list_display = ("id", "document")
+    list_select_related = ("document",)
+
+
+@admin.register(MangoPayBankAccount)
+class MangoPayBankAccountAdmin(MangoPayAdmin):
+    list_display = ("id", "mangopay_id", "mangopay_user", "account_type")
+    list_select_related = ("mangopay_user__user",)
+    search_fields = ("mangopay_id",)
+    create_task = tasks.create_mangopay_bank_accounts_chunk
+    actions = ["create_remotely"]
+
+
+@admin.register(MangoPayWallet)
+class MangoPayWalletAdmin(MangoPayAdmin):
+    list_display = ("id", "mangopay_id", "mangopay_user", "currency", "description")
+    list_select_related = ("mangopay_user__user",)
+    search_fields = ("mangopay_id",)
+    create_task = tasks.create_mangopay_wallets_chunk
+    actions = ["create_remotely"]
+
+
+@admin.register(MangoPayPayIn)
+class MangoPayPayInAdmin(admin.ModelAdmin):
+    list_display = ("id", "mangopay_id", "mangopay_user", "mangopay_wallet", "payment_type", "status",
+                    "execution_date")
+    list_select_related = ("mangopay_user__user", "mangopay_wallet")
+    list_filter = ("status", "payment_type")
+    search_fields = ("mangopay_id",)
+
+
+@admin.register(MangoPayPayOut)
+class MangoPayPayOutAdmin(MangoPayAdmin):
+    list_display = ("id", "mangopay_id", "mangopay_user", "mangopay_wallet", "mangopay_bank_account", "status",
+                    "execution_date")
+    list_select_related = ("mangopay_user__user", "mangopay_wallet", "mangopay_bank_account")
+    list_filter = ("status",)
+    search_fields = ("mangopay_id",)
+    create_task = tasks.create_mangopay_pay_outs_chunk
+    actions = ["create_remotely", "refresh_status"]
+
+    def create_remotely(self, request, queryset):
+        # Batchable payouts are created through their batch payout
+        self.enqueue(request, queryset.filter(CREATABLE, mangopay_id__isnull=True), self.create_task)
+    create_remotely.short_description = MangoPayAdmin.create_remotely.short_description
+
+    def refresh_status(self, request, queryset):
+        self.enqueue(request, queryset.filter(NOT_COALESCED, mangopay_id__isnull=False).exclude(
+            status__in=FINAL_STATUSES), tasks.update_mangopay_pay_outs_chunk)
+    refresh_status.short_description = "Refresh the status of the selected payouts"
+
+
+@admin.register(MangoPayPayOutBatchItem)
+class MangoPayPayOutBatchItemAdmin(admin.ModelAdmin):
+    list_display = ("id", "batch", "pay_out")
+    list_select_related = ("batch", "pay_out")
+
+
+@admin.register(MangoPayCard)
+class MangoPayCardAdmin(MangoPayAdmin):
+    list_display = ("id", "mangopay_id", "alias", "expiration_date", "is_active", "is_valid")
+    list_filter = ("is_active", "is_valid")
+    search_fields = ("mangopay_id", "alias")
+    actions = ["refresh_info"]
+
+    def refresh_info(self, request, queryset):
+        # Cards are refreshed from the list of their user's cards
+        users = MangoPayCardRegistration.objects.filter(
+            mangopay_card__in=queryset.filter(mangopay_id__isnull=False),
+            mangopay_user__mangopay_id__isnull=False,
+        ).values_list("mangopay_user_id", flat=True).distinct()
+        self.enqueue(request, MangoPayUser.objects.filter(id__in=users), tasks.refresh_mangopay_cards)
+    refresh_info.short_description = "Refresh the info of the selected cards"
+
+
+@admin.register(MangoPayCardRegistration)
+class MangoPayCardRegistrationAdmin(admin.ModelAdmin):
+    list_display = ("id", "mangopay_id", "mangopay_user", "mangopay_card", "currency", "pooled_at")
+    list_select_related = ("mangopay_user__user", "mangopay_card")
+    search_fields = ("mangopay_id",)
+
+
+@admin.register(MangoPayInRefund)
+class MangoPayInRefundAdmin(MangoPayAdmin):
+    list_display = ("id", "mangopay_id", "mangopay_user", "mangopay_pay_in", "status", "execution_date")
+    list_select_related = ("mangopay_user__user", "mangopay_pay_in")
+    list_filter = ("status",)
+    search_fields = ("mangopay_id",)
+    create_task = tasks.create_mangopay_refunds_chunk
+    actions = ["create_remotely"]
+
+
+@admin.register(MangoPayTransfer)
+class MangoPayTransferAdmin(MangoPayAdmin):
+    list_display = ("id", "mangopay_id", "mangopay_debited_wallet", "mangopay_credited_wallet", "status",
+                    "execution_date")
+    list_select_related = ("mangopay_debited_wallet", "mangopay_credited_wallet")
+    list_filter = ("status",)
+    search_fields = ("mangopay_id",)
+    create_task = tasks.create_mangopay_transfers_chunk
+    actions = ["create_remotely"]
+
+
+@admin.register(MangoPayImportCheckpoint)
+class MangoPayImportCheckpointAdmin(admin.ModelAdmin):
+    list_display = ("name", "position", "updated")
+
+
+@admin.register(MangoPayTransactionPayload)
+class MangoPayTransactionPayloadAdmin(admin.ModelAdmin):
+    list_display = ("mangopay_id", "resource", "created")
+    search_fields = ("mangopay_id",)
+
+
+@admin.register(MangoPayOutboxEntry)
+class MangoPayOutboxEntryAdmin(admin.ModelAdmin):
+    list_display = ("id", "task", "created")
+
+
+@admin.register(MangoPayStatusEvent)
+class MangoPayStatusEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "object_id", "status", "result_code", "observed")
+    list_filter = ("kind", "status")
+
+
+admin.site.register(MangoPayNaturalUser, MangoPayUserAdmin)
+admin.site.register(MangoPayLegalUser, MangoPayUserAdmin)
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import MangoPayPayOut, MangoPayPayOutBatchItem
+
+# Payouts that are created remotely: those never batched and the batches
+# themselves, but not the payouts coalesced into a batch.
+NOT_COALESCED = Q(mangopay_batch_item__isnull=True) | Q(mangopay_batch_item__batch_id=F("id"))
+
+# Payouts that may be created remotely now: those not batchable and the
+# batches. Batchable payouts are only created once batched, so a payout is
+# never both created on its own and coalesced into a batch.
+CREATABLE = Q(mangopay_batch_item__isnull=True, batchable=False) | Q(mangopay_batch_item__batch_id=F("id"))
+
+
+def pending_pay_outs():
+    batched = MangoPayPayOutBatchItem.objects.all()
+    return MangoPayPayOut.objects.filter(
+        batchable=True, mangopay_id__isnull=True, status__isnull=True
+    ).exclude(
+        id__in=batched.values("pay_out_id")
+    ).exclude(
+        id__in=batched.values("batch_id")
+    )
+
+
+def batch_pending_pay_outs():
+    """
+    Coalesce pending batchable payouts that debit the same wallet to the
+    same bank account in the same currency into a single payout per group.
+
+    Every payout picked up is linked to its batch so that it is not picked
+    up again by a later run. Returns the payouts to create remotely.
+    """
+    with transaction.atomic():
+        groups = OrderedDict()
+        for pay_out in pending_pay_outs().select_for_update().order_by("id"):
+            key = (pay_out.mangopay_wallet_id,
+                   pay_out.mangopay_bank_account_id,
+                   str(pay_out.debited_funds.currency))
+            groups.setdefault(key, []).append(pay_out)
+
+        batches = []
+        items = []
+        for pay_outs in groups.values():
+            if len(pay_outs) == 1:
+                batch = pay_outs[0]
+            else:
+                first = pay_outs[0]
+                batch = MangoPayPayOut.objects.create(
+                    mangopay_user_id=first.mangopay_user_id,
+                    mangopay_wallet_id=first.mangopay_wallet_id,
+                    mangopay_bank_account_id=first.mangopay_bank_account_id,
+                    debited_funds=sum((p.debited_funds for p in pay_outs[1:]), first.debited_funds),
+                    fees=sum((p.fees for p in pay_outs[1:]), first.fees),
+                )
+            batches.append(batch)
+            items.extend(MangoPayPayOutBatchItem(batch=batch, pay_out=pay_out) for pay_out in pay_outs)
+
+        MangoPayPayOutBatchItem.objects.bulk_create(items)
+    return batches
@@ -0,0 +1,139 @@
+import zlib
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+
+import pytz
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+DEFAULT_CALENDARS = {
+    "EUR": "mangopay2.calendars.TARGET2Calendar",
+}
+DEFAULT_CALENDAR = "mangopay2.calendars.BusinessCalendar"
+
+
+def easter_sunday(year):
+    # The anonymous Gregorian algorithm
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+class BusinessCalendar(object):
+    """
+    The days and hours banks work on. Every weekday is a business day;
+    subclasses return the holidays of a year from ``holidays()``.
+
+    The next business day of every day of a year is computed once, so
+    finding it is a list lookup.
+    """
+    timezone = "Europe/Luxembourg"
+    opening = time(9)
+    closing = time(17)
+
+    def __init__(self):
+        self.tz = pytz.timezone(getattr(settings, "MANGOPAY_BUSINESS_TIMEZONE", self.timezone))
+        self.opening, self.closing = getattr(settings, "MANGOPAY_BUSINESS_HOURS", (self.opening, self.closing))
+        self._next_business_days = {}
+
+    def holidays(self, year):
+        return set()
+
+    def is_business_day(self, day):
+        return self.next_business_day(day) == day
+
+    def next_business_day(self, day):
+        """
+        The first business day on or after ``day``.
+        """
+        days = self._next_business_days.get(day.year)
+        if days is None:
+            days = self._next_business_days[day.year] = self._year(day.year)
+        return days[day.timetuple().tm_yday - 1]
+
+    def _year(self, year):
+        closed = self.holidays(year)
+        following = self._scan(date(year + 1, 1, 1))
+        days = []
+        day = date(year, 12, 31)
+        while day.year == year:
+            if day.weekday() < 5 and day not in closed:
+                following = day
+            days.append(following)
+            day -= timedelta(days=1)
+        days.reverse()
+        return days
+
+    def _scan(self, day):
+        closed = self.holidays(day.year)
+        while day.weekday() >= 5 or day in closed:
+            day += timedelta(days=1)
+            if day.month == 1 and day.day == 1:
+                closed = self.holidays(day.year)
+        return day
+
+    def slot(self, day, key):
+        """
+        The time of ``day`` within business hours given to ``key``, spread
+        evenly over business hours across keys.
+        """
+        start = self.tz.localize(datetime.combine(day, self.opening))
+        end = self.tz.localize(datetime.combine(day, self.closing))
+        span = int((end - start).total_seconds())
+        return start + timedelta(seconds=zlib.crc32(str(key).encode()) % span)
+
+    def next_slot(self, after, key, min_delay=timedelta(hours=1)):
+        """
+        The first slot of ``key`` on a business day at least ``min_delay``
+        after ``after``, an aware datetime.
+        """
+        earliest = after.astimezone(self.tz) + min_delay
+        day = self.next_business_day(earliest.date())
+        slot = self.slot(day, key)
+        if slot < earliest:
+            slot = self.slot(self.next_business_day(day + timedelta(days=1)), key)
+        return slot
+
+
+class TARGET2Calendar(BusinessCalendar):
+    # The days the euro payment system is closed
+
+    def holidays(self, year):
+        easter = easter_sunday(year)
+        return {
+            date(year, 1, 1),
+            easter - timedelta(days=2),
+            easter + timedelta(days=1),
+            date(year, 5, 1),
+            date(year, 12, 25),
+            date(year, 12, 26),
+        }
+
+
+@lru_cache(maxsize=None)
+def _calendar(path):
+    return import_string(path)()
+
+
+def calendar_for(currency):
+    """
+    The business calendar of a currency, from ``MANGOPAY_BUSINESS_CALENDARS``.
+    """
+    calendars = dict(DEFAULT_CALENDARS, **getattr(settings, "MANGOPAY_BUSINESS_CALENDARS", {}))
+    return _calendar(calendars.get(str(currency), DEFAULT_CALENDAR))
+
+
+@receiver(setting_changed)
+def reset_calendars(setting, **kwargs):
+    if setting in ("MANGOPAY_BUSINESS_CALENDARS", "MANGOPAY_BUSINESS_TIMEZONE", "MANGOPAY_BUSINESS_HOURS"):
+        _calendar.cache_clear()
@@ -0,0 +1,90 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import now
+from mangopay.resources import User
+
+from .db import bulk_update
+from .models import MangoPayCard, expiration_date_as_date
+
+
+def mangopay_user_ids_with_cards_to_refresh():
+    """
+    Ids of the created users that have at least one created card that
+    does not expire beyond ``MANGOPAY_CARD_REFRESH_HORIZON`` days.
+    """
+    horizon = now().date() + timedelta(days=getattr(settings, "MANGOPAY_CARD_REFRESH_HORIZON", 365))
+    return list(MangoPayCard.objects.filter(
+        Q(expiration_month__lt=horizon) | Q(expiration_month__isnull=True),
+        mangopay_id__isnull=False,
+        mangopay_card_registration__mangopay_user__mangopay_id__isnull=False,
+    ).order_by(
+        "mangopay_card_registration__mangopay_user_id"
+    ).values_list("mangopay_card_registration__mangopay_user_id", flat=True).distinct())
+
+
+def remote_cards(mangopay_id, per_page=100):
+    user = User(id=mangopay_id)
+    page = 1
+    while True:
+        cards = user.cards.all(page=page, per_page=per_page)
+        for card in cards:
+            yield card
+        if len(cards) < per_page:
+            return
+        page += 1
+
+
+def refresh_cards(mangopay_user_id, mangopay_id):
+    """
+    Update the info of a user's cards from the paginated list of the
+    user's cards, writing the changed ones with a single UPDATE.
+    """
+    cards = MangoPayCard.objects.filter(
+        mangopay_id__isnull=False,
+        mangopay_card_registration__mangopay_user_id=mangopay_user_id)
+    local_cards = {str(card.mangopay_id): card for card in cards}
+
+    changed = []
+    for card in remote_cards(mangopay_id):
+        local_card = local_cards.get(str(card.get_pk()))
+        if local_card is not None and local_card._update(card):
+            changed.append(local_card)
+    return bulk_update(changed, MangoPayCard.INFO_FIELDS)
+
+
+def expiring_card_ids(months=1):
+    """
+    Ids of the active cards expiring in the next ``months`` calendar
+    months, found with a range scan on ``expiration_month``.
+    """
+    today = now().date()
+    start = date_of_month(today.year, today.month + 1)
+    end = date_of_month(today.year, today.month + 1 + months)
+    return MangoPayCard.objects.expiring(start, end).order_by("expiration_month", "id").values_list("id", flat=True)
+
+
+def date_of_month(year, month):
+    return date(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+
+def backfill_expiration_months(apps=None, schema_editor=None, chunk_size=1000):
+    """
+    Fill ``MangoPayCard.expiration_month`` for existing cards, one
+    transaction per chunk so the table is never locked for long. It can
+    be used as a ``RunPython`` operation in a non-atomic migration.
+    """
+    model = apps.get_model("mangopay2", "MangoPayCard") if apps else MangoPayCard
+    cards = model.objects.filter(expiration_month__isnull=True, expiration_date__isnull=False).order_by("pk")
+    last = 0
+    while True:
+        with transaction.atomic():
+            chunk = list(cards.filter(pk__gt=last).only("pk", "expiration_date")[:chunk_size])
+            if not chunk:
+                return
+            for card in chunk:
+                card.expiration_month = expiration_date_as_date(card.expiration_date)
+            bulk_update([card for card in chunk if card.expiration_month], ["expiration_month"])
+        last = chunk[-1].pk
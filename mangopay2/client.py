@@ -1,12 +1,182 @@
+import copy
+import threading
+from collections import Counter
+from functools import partial
+
 from django.conf import settings
+from django.core.cache import caches
 from mangopay.auth import StaticStorageStrategy
 
 import mangopay
 from mangopay.api import APIRequest
+from mangopay.exceptions import APIError
+
+
+class CircuitOpenError(APIError):
+    """
+    Raised without calling the API while the circuit of an endpoint family
+    is open. ``retry_after`` is the number of seconds it stays open.
+    """
+
+    def __init__(self, family, retry_after):
+        self.family = family
+        self.retry_after = retry_after
+        super(CircuitOpenError, self).__init__("Circuit open for %s, retry in %ss" % (family, retry_after))
+
+
+def _circuit_cache():
+    return caches[getattr(settings, "MANGOPAY_CIRCUIT_BREAKER_CACHE", "default")]
+
+
+def endpoint_family(url):
+    """
+    The first segment of the path of a request, such as ``"payins"`` for
+    ``/payins/card/direct``.
+    """
+    return url.lstrip("/").split("/", 1)[0].split("?", 1)[0].lower()
+
+
+def is_failure(exc):
+    # Connection errors and timeouts have no status code
+    return exc.code is None or exc.code >= 500
+
+
+class CircuitBreaker(object):
+    """
+    Counts the failed requests of an endpoint family in the cache so the
+    count is shared by every worker. The circuit opens once
+    ``MANGOPAY_CIRCUIT_BREAKER_THRESHOLD`` requests failed within
+    ``MANGOPAY_CIRCUIT_BREAKER_WINDOW`` seconds and stays open for
+    ``MANGOPAY_CIRCUIT_BREAKER_COOLDOWN`` seconds. The first request after
+    that is a trial: a single failure opens the circuit again.
+    """
+
+    def __init__(self, family):
+        self.family = family
+        self.cache = _circuit_cache()
+        self.threshold = getattr(settings, "MANGOPAY_CIRCUIT_BREAKER_THRESHOLD", 5)
+        self.window = getattr(settings, "MANGOPAY_CIRCUIT_BREAKER_WINDOW", 60)
+        self.cooldown = getattr(settings, "MANGOPAY_CIRCUIT_BREAKER_COOLDOWN", 30)
+        self.open_key = "mangopay_circuit_open:%s" % family
+        self.failures_key = "mangopay_circuit_failures:%s" % family
+
+    def before(self):
+        """
+        Raise ``CircuitOpenError`` while the circuit is open. Returns the
+        number of recent failures.
+        """
+        state = self.cache.get_many([self.open_key, self.failures_key])
+        if self.open_key in state:
+            raise CircuitOpenError(self.family, self.cooldown)
+        return state.get(self.failures_key, 0)
+
+    def succeeded(self, failures):
+        if failures:
+            self.cache.delete(self.failures_key)
+
+    def failed(self):
+        self.cache.add(self.failures_key, 0, self.window)
+        try:
+            failures = self.cache.incr(self.failures_key)
+        except ValueError:
+            # The count expired between add and incr
+            failures = 1
+            self.cache.set(self.failures_key, failures, self.window)
+        if failures >= self.threshold:
+            self.cache.set(self.open_key, True, self.cooldown)
+            self.cache.set(self.failures_key, self.threshold - 1, self.cooldown + self.window)
+
+
+class SingleFlight(object):
+    """
+    Runs a call once for all the threads asking for the same key at the
+    same time: the first thread makes the call and the others wait for its
+    result, which they share, or its exception.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = Counter()
+
+    def do(self, key, call):
+        with self.lock:
+            flight = self.calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.calls[key] = _Flight()
+            self.stats["calls" if leader else "coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = call()
+            return flight.result
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            flight.done.set()
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+in_flight_gets = SingleFlight()
+
+
+def coalescing_stats():
+    """
+    The number of GET requests sent to the API and of those that shared the
+    result of an identical request in flight, since the process started.
+    """
+    with in_flight_gets.lock:
+        return {"calls": in_flight_gets.stats["calls"], "coalesced": in_flight_gets.stats["coalesced"]}
+
+
+class MangoPayAPIRequest(APIRequest):
+
+    def request(self, method, url, data=None, idempotency_key=None, oauth_request=False, **params):
+        call = partial(self._request, method, url, data, idempotency_key, oauth_request, **params)
+        if method == "GET" and getattr(settings, "MANGOPAY_COALESCE_GETS", True):
+            key = (self.api_url, self.client_id, url, repr(sorted(params.items())))
+            shared = in_flight_gets.do(key, call)
+            if isinstance(shared, tuple):
+                # Every caller gets its own copy of the payload to build entities from
+                result, data = shared
+                return result, copy.deepcopy(data)
+            return shared
+        return call()
+
+    def _request(self, method, url, *args, **kwargs):
+        if not getattr(settings, "MANGOPAY_CIRCUIT_BREAKER", True):
+            return super(MangoPayAPIRequest, self).request(method, url, *args, **kwargs)
+
+        breaker = CircuitBreaker(endpoint_family(url))
+        failures = breaker.before()
+        try:
+            result = super(MangoPayAPIRequest, self).request(method, url, *args, **kwargs)
+        except APIError as exc:
+            if is_failure(exc):
+                breaker.failed()
+            raise
+        breaker.succeeded(failures)
+        return result
 
 
 def get_mangopay_api_handler():
-    return APIRequest(storage_strategy=StaticStorageStrategy())
+    return MangoPayAPIRequest(storage_strategy=StaticStorageStrategy())
 
 
 mangopay.client_id = settings.MANGOPAY_CLIENT_ID
@@ -0,0 +1,23 @@
+from django.db.models import Case, Value, When
+
+
+def bulk_update(instances, fields, batch_size=500):
+    """
+    Write ``fields`` of ``instances`` with a single UPDATE per batch, as
+    ``QuerySet.bulk_update()`` does on newer Django versions. Returns the
+    number of rows updated.
+    """
+    if not instances:
+        return 0
+    model = type(instances[0])
+    fields = [model._meta.get_field(name) for name in fields]
+    updated = 0
+    for start in range(0, len(instances), batch_size):
+        batch = instances[start:start + batch_size]
+        values = {}
+        for field in fields:
+            whens = [When(pk=instance.pk, then=Value(getattr(instance, field.attname), output_field=field))
+                     for instance in batch]
+            values[field.name] = Case(*whens, output_field=field)
+        updated += model._default_manager.filter(pk__in=[instance.pk for instance in batch]).update(**values)
+    return updated
@@ -0,0 +1,65 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+
+from .models import MangoPayDocument, VALIDATION_ASKED
+
+
+def _delay(setting, default):
+    return timedelta(seconds=getattr(settings, setting, default))
+
+
+def poll_delay(validation_asked_at, polled_at):
+    """
+    How long to wait after the last poll of a document: half the time it
+    had been waiting for its validation then, within
+    ``MANGOPAY_DOCUMENT_POLL_MIN_DELAY`` and ``MANGOPAY_DOCUMENT_POLL_MAX_DELAY``.
+    """
+    min_delay = _delay("MANGOPAY_DOCUMENT_POLL_MIN_DELAY", 60 * 60)
+    max_delay = _delay("MANGOPAY_DOCUMENT_POLL_MAX_DELAY", 8 * 60 * 60)
+    waited = polled_at - validation_asked_at if validation_asked_at else timedelta(0)
+    return min(max(waited / 2, min_delay), max_delay)
+
+
+def documents_due(at, limit=None):
+    """
+    Ids of at most ``limit`` documents waiting for their validation that
+    are due to be polled at ``at``, those never polled first and then the
+    longest unpolled. A document is first polled
+    ``MANGOPAY_DOCUMENT_FIRST_POLL_DELAY`` seconds after its validation was
+    asked for.
+
+    The database only returns the documents out of their minimum delay;
+    which of those waited long enough is decided here.
+    """
+    first_delay = _delay("MANGOPAY_DOCUMENT_FIRST_POLL_DELAY", 60 * 60)
+    min_delay = _delay("MANGOPAY_DOCUMENT_POLL_MIN_DELAY", 60 * 60)
+    never_polled = Q(polled_at__isnull=True) & (
+        Q(validation_asked_at__isnull=True) | Q(validation_asked_at__lte=at - first_delay))
+    documents = MangoPayDocument.objects.filter(
+        never_polled | Q(polled_at__lte=at - min_delay), status=VALIDATION_ASKED
+    ).order_by(F("polled_at").asc(nulls_first=True), "id").values_list("id", "validation_asked_at", "polled_at")
+
+    due = []
+    for id, validation_asked_at, polled_at in documents.iterator():
+        if polled_at is None or at - polled_at >= poll_delay(validation_asked_at, polled_at):
+            due.append(id)
+            if len(due) == limit:
+                break
+    return due
+
+
+def spread_countdowns(count, interval, per_minute):
+    """
+    Countdowns spreading ``count`` tasks evenly over ``interval`` seconds,
+    each at a random time within its share of the interval. There are no
+    more than ``per_minute`` tasks a minute on average; the tasks beyond
+    that get no countdown and are left for the next interval.
+    """
+    count = min(count, per_minute * interval // 60)
+    if not count:
+        return []
+    share = interval / count
+    return [int(i * share + random.uniform(0, share)) for i in range(count)]
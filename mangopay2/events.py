@@ -0,0 +1,120 @@
+"""
+The status events of the transactions and documents, and the operations
+partitioning their table by month.
+
+The app ships no migrations. On PostgreSQL the table can be created
+partitioned on ``observed`` by using ``partitioned_table_operations()`` as
+the database operations of the migration creating
+``MangoPayStatusEvent``, next to the state operations ``makemigrations``
+generates for it. The partitions of the coming months are then created
+by the ``CreateStatusEventPartitions`` periodic task. Events of a month
+without a partition land in the default partition, so recording them
+never fails a status update.
+"""
+from django.db import connection, migrations, transaction
+from django.utils.timezone import now
+
+from .cards import date_of_month
+from .models import MangoPayStatusEvent, STATUS_EVENT_KINDS
+
+TABLE = MangoPayStatusEvent._meta.db_table
+DEFAULT_PARTITION = "%s_default" % TABLE
+
+
+def timeline(instance):
+    """
+    Iterate over the status events of a transaction or a document, oldest
+    first, without loading them all in memory.
+    """
+    kind = STATUS_EVENT_KINDS[instance._meta.concrete_model]
+    return MangoPayStatusEvent.objects.filter(
+        kind=kind, object_id=instance.pk
+    ).order_by("observed", "id").iterator()
+
+
+def create_partitioned_table_sql():
+    # The primary key of a partitioned table must include the partition key
+    return [
+        'CREATE TABLE "%s" ('
+        '"id" bigserial NOT NULL, '
+        '"kind" smallint NOT NULL CHECK ("kind" >= 0), '
+        '"object_id" integer NOT NULL CHECK ("object_id" >= 0), '
+        '"status" varchar(20) NOT NULL, '
+        '"result_code" varchar(6) NULL, '
+        '"observed" timestamp with time zone NOT NULL, '
+        'PRIMARY KEY ("id", "observed")'
+        ') PARTITION BY RANGE ("observed")' % TABLE,
+        'CREATE INDEX "%s_kind_object_id_observed_idx" ON "%s" ("kind", "object_id", "observed")' % (TABLE, TABLE),
+        'CREATE TABLE "%s" PARTITION OF "%s" DEFAULT' % (DEFAULT_PARTITION, TABLE),
+    ]
+
+
+def partition_name(month):
+    return "%s_y%dm%02d" % (TABLE, month.year, month.month)
+
+
+def month_bounds(month):
+    return month.isoformat(), date_of_month(month.year, month.month + 1).isoformat()
+
+
+def create_partition_sql(month):
+    return 'CREATE TABLE IF NOT EXISTS "%s" PARTITION OF "%s" FOR VALUES FROM (\'%s\') TO (\'%s\')' % (
+        (partition_name(month), TABLE) + month_bounds(month))
+
+
+def move_to_partition_sql(month):
+    """
+    Move the events of ``month`` out of the default partition into a new
+    partition. They are deleted from the default partition before the new
+    one is attached, which checks the default one holds none of its rows.
+    """
+    name = partition_name(month)
+    where = '"observed" >= \'%s\' AND "observed" < \'%s\'' % month_bounds(month)
+    return [
+        'CREATE TABLE "%s" (LIKE "%s" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)' % (name, TABLE),
+        'INSERT INTO "%s" SELECT * FROM "%s" WHERE %s' % (name, DEFAULT_PARTITION, where),
+        'DELETE FROM "%s" WHERE %s' % (DEFAULT_PARTITION, where),
+        'ALTER TABLE "%s" ATTACH PARTITION "%s" FOR VALUES FROM (\'%s\') TO (\'%s\')' % (
+            (TABLE, name) + month_bounds(month)),
+    ]
+
+
+def coming_months(months, start=None):
+    start = start or now().date()
+    return [date_of_month(start.year, start.month + i) for i in range(months)]
+
+
+def partitioned_table_operations(months=3):
+    """
+    Create the table partitioned by month, with a default partition and
+    the partitions of the current month and of the ``months - 1`` next ones.
+    """
+    sql = create_partitioned_table_sql() + [create_partition_sql(month) for month in coming_months(months)]
+    return [migrations.RunSQL(sql, 'DROP TABLE "%s"' % TABLE)]
+
+
+def create_partitions(months=3):
+    """
+    Create the missing partitions of the current month and of the
+    ``months - 1`` next ones, moving their events out of the default
+    partition if a run was missed. Does nothing unless the table is
+    partitioned.
+    """
+    if connection.vendor != "postgresql":
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE])
+        if cursor.fetchone() is None:
+            return
+        for month in coming_months(months):
+            cursor.execute("SELECT to_regclass(%s)", [partition_name(month)])
+            if cursor.fetchone()[0] is not None:
+                continue
+            start, end = month_bounds(month)
+            cursor.execute('SELECT 1 FROM "%s" WHERE "observed" >= %%s AND "observed" < %%s LIMIT 1'
+                           % DEFAULT_PARTITION, [start, end])
+            if cursor.fetchone() is None:
+                cursor.execute(create_partition_sql(month))
+            else:
+                for sql in move_to_partition_sql(month):
+                    cursor.execute(sql)
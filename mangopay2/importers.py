@@ -0,0 +1,125 @@
+"""
+Import the users created on MangoPay outside of this app.
+
+The users endpoint is read page by page, oldest first, and each page is
+upserted in one transaction together with the position reached, so an
+interrupted import resumes from the last page it committed.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from mangopay.constants import USER_TYPE_CHOICES
+from mangopay.resources import User, NaturalUser, LegalUser
+
+from .db import bulk_update
+from .models import MangoPayUser, MangoPayNaturalUser, MangoPayLegalUser, MangoPayImportCheckpoint
+
+
+def _address_line(address):
+    return address.address_line_1 if address else None
+
+
+def natural_user_values(user):
+    return {
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "email": user.email,
+        "birthday": user.birthday,
+        "nationality": user.nationality,
+        "country_of_residence": user.country_of_residence,
+        "address": _address_line(user.address),
+        "occupation": user.occupation,
+        "income_range": user.income_range,
+    }
+
+
+def legal_user_values(user):
+    return {
+        "type": USER_TYPE_CHOICES.legal,
+        "business_name": user.name,
+        "business_email": user.email,
+        "legal_person_type": user.legal_person_type,
+        "headquarters_address": _address_line(user.headquarters_address),
+        "first_name": user.legal_representative_first_name,
+        "last_name": user.legal_representative_last_name,
+        "email": user.legal_representative_email,
+        "birthday": user.legal_representative_birthday,
+        "nationality": user.legal_representative_nationality,
+        "country_of_residence": user.legal_representative_country_of_residence,
+        "address": _address_line(user.legal_representative_address),
+    }
+
+
+USER_MODELS = {
+    NaturalUser: (MangoPayNaturalUser, natural_user_values),
+    LegalUser: (MangoPayLegalUser, legal_user_values),
+}
+
+
+def auth_users_by_email(remote_users):
+    """
+    Map the MangoPay id of each remote user to the id of the auth user with
+    the same email, if there is one.
+    """
+    emails = set(user.email for user in remote_users if user.email)
+    auth_users = dict(get_user_model()._default_manager.filter(email__in=emails).values_list("email", "id"))
+    return dict((str(user.get_pk()), auth_users.get(user.email)) for user in remote_users)
+
+
+def upsert_users(remote_users, auth_users=auth_users_by_email):
+    """
+    Update the local users matching the MangoPay ids of ``remote_users`` and
+    create the missing ones for the auth users given by ``auth_users``.
+    Remote users without an auth user, or whose auth user already has a
+    ``MangoPayUser``, are skipped. Returns the number of users created and
+    updated.
+    """
+    remote_users = [user for user in remote_users if type(user) in USER_MODELS]
+    existing = MangoPayUser.objects.filter(
+        mangopay_id__in=[str(user.get_pk()) for user in remote_users]).select_subclasses()
+    existing = dict((user.mangopay_id, user) for user in existing)
+    auth_user_ids = auth_users([user for user in remote_users if str(user.get_pk()) not in existing])
+    taken = set(MangoPayUser.objects.filter(
+        user_id__in=[id for id in auth_user_ids.values() if id]).values_list("user_id", flat=True))
+
+    created = 0
+    updated = {}
+    for remote_user in remote_users:
+        model, values = USER_MODELS[type(remote_user)]
+        mangopay_id = str(remote_user.get_pk())
+        user = existing.get(mangopay_id)
+        if user is None:
+            auth_user_id = auth_user_ids.get(mangopay_id)
+            if auth_user_id is None or auth_user_id in taken:
+                continue
+            # Multi-table inherited models cannot be bulk created
+            model(mangopay_id=mangopay_id, user_id=auth_user_id, **values(remote_user)).save()
+            taken.add(auth_user_id)
+            created += 1
+        elif type(user) is model:
+            fields = values(remote_user)
+            for name, value in fields.items():
+                setattr(user, name, value)
+            updated.setdefault(model, (list(fields), []))[1].append(user)
+
+    for fields, users in updated.values():
+        bulk_update(users, fields)
+    return created, sum(len(users) for fields, users in updated.values())
+
+
+def import_users(per_page=100, auth_users=auth_users_by_email):
+    """
+    Upsert every remote user page by page, starting from the position saved
+    by the previous run.
+    """
+    checkpoint, _ = MangoPayImportCheckpoint.objects.get_or_create(name="users")
+    page, skip = divmod(checkpoint.position, per_page)
+    while True:
+        remote_users = User.all(page=page + 1, per_page=per_page, Sort="CreationDate:ASC")
+        with transaction.atomic():
+            upsert_users(list(remote_users)[skip:], auth_users)
+            checkpoint.position = page * per_page + len(remote_users)
+            checkpoint.save()
+        if len(remote_users) < per_page:
+            return checkpoint.position
+        page += 1
+        skip = 0
@@ -0,0 +1,61 @@
+"""
+Operations building the indexes of the models without blocking writes.
+
+The app ships no migrations. On PostgreSQL, large tables can get these
+indexes with ``CREATE INDEX CONCURRENTLY`` by using
+``concurrent_index_operations()`` as the database operations of a
+non-atomic migration, next to the state operations ``makemigrations``
+generates for them.
+"""
+from django.db import migrations
+from django.db.backends.utils import truncate_name
+
+from .models import (
+    MangoPayUser, MangoPayDocument, MangoPayBankAccount, MangoPayWallet, MangoPayPayIn, MangoPayPayOut,
+    MangoPayCard, MangoPayCardRegistration, MangoPayInRefund, MangoPayTransfer, MangoPayTransactionPayload
+)
+
+# The indexes on remote ids and on the columns the tasks poll on, as
+# (model, fields, unique). Unique indexes leave out the rows not created
+# remotely yet.
+INDEXES = [
+    (MangoPayUser, ("mangopay_id",), True),
+    (MangoPayDocument, ("mangopay_id",), True),
+    (MangoPayDocument, ("status",), False),
+    (MangoPayDocument, ("status", "polled_at"), False),
+    (MangoPayBankAccount, ("mangopay_id",), True),
+    (MangoPayWallet, ("mangopay_id",), True),
+    (MangoPayPayIn, ("mangopay_id",), True),
+    (MangoPayPayOut, ("mangopay_id", "status"), False),
+    (MangoPayCard, ("mangopay_id",), True),
+    (MangoPayCard, ("is_active", "expiration_month"), False),
+    (MangoPayCardRegistration, ("mangopay_id",), True),
+    (MangoPayCardRegistration, ("mangopay_user", "currency", "pooled_at"), False),
+    (MangoPayInRefund, ("mangopay_id",), True),
+    (MangoPayTransfer, ("mangopay_id",), True),
+    (MangoPayTransactionPayload, ("mangopay_id",), True),
+]
+
+
+def index_name(table, columns, unique=False):
+    return truncate_name("%s_%s_%s" % (table, "_".join(columns), "uniq" if unique else "idx"), 63)
+
+
+def create_index_sql(table, columns, name, unique=False):
+    sql = 'CREATE %sINDEX CONCURRENTLY IF NOT EXISTS "%s" ON "%s" (%s)' % (
+        "UNIQUE " if unique else "", name, table, ", ".join('"%s"' % column for column in columns))
+    if unique:
+        sql += " WHERE %s" % " AND ".join('"%s" IS NOT NULL' % column for column in columns)
+    return sql
+
+
+def create_index_concurrently(model, fields, unique=False):
+    table = model._meta.db_table
+    columns = [model._meta.get_field(name).column for name in fields]
+    name = index_name(table, columns, unique)
+    return migrations.RunSQL(create_index_sql(table, columns, name, unique),
+                             'DROP INDEX CONCURRENTLY IF EXISTS "%s"' % name)
+
+
+def concurrent_index_operations():
+    return [create_index_concurrently(model, fields, unique) for model, fields, unique in INDEXES]
@@ -0,0 +1,48 @@
+"""
+Loader querysets for the models in ``mangopay2.models``.
+
+Each loader fetches a row together with every relation its remote
+operation walks through, so building the SDK entities does not trigger
+lazy foreign key queries. Related users, wallets and bank accounts are
+only sent by their MangoPay id, so their base rows are enough; only
+creating or updating a user itself needs its ``MangoPayUser`` subclass
+and the auth user behind it.
+"""
+from .models import (
+    MangoPayUser, MangoPayBankAccount, MangoPayDocument, MangoPayWallet, MangoPayPayOut, MangoPayTransfer,
+    MangoPayInRefund
+)
+
+
+USER_SUBCLASS_RELATED = ("mangopaynaturaluser__user", "mangopaylegaluser__user")
+
+
+def mangopay_users():
+    return MangoPayUser.objects.select_related(*USER_SUBCLASS_RELATED).select_subclasses()
+
+
+def bank_accounts():
+    # The owner name is taken from the auth user
+    return MangoPayBankAccount.objects.select_related("mangopay_user__user")
+
+
+def documents():
+    return MangoPayDocument.objects.select_related("mangopay_user")
+
+
+def wallets():
+    return MangoPayWallet.objects.select_related("mangopay_user")
+
+
+def pay_outs():
+    return MangoPayPayOut.objects.select_related("mangopay_user", "mangopay_wallet", "mangopay_bank_account")
+
+
+def transfers():
+    return MangoPayTransfer.objects.select_related(
+        "mangopay_debited_wallet__mangopay_user", "mangopay_credited_wallet__mangopay_user")
+
+
+def refunds():
+    # A refund is keyed on the remote ids of its user and pay in only
+    return MangoPayInRefund.objects.select_related("mangopay_user", "mangopay_pay_in")
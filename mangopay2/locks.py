@@ -0,0 +1,46 @@
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .signals import wallet_lock_acquired
+
+
+class WalletLockTimeout(Exception):
+    pass
+
+
+def _lock_cache():
+    return caches[getattr(settings, "MANGOPAY_LOCK_CACHE", "default")]
+
+
+@contextmanager
+def wallet_lock(wallet_id):
+    """
+    Hold a cache based lease on the wallet while money leaves it, so that
+    concurrent debits of the same wallet run one after the other. Debits
+    of other wallets are not affected.
+    """
+    cache = _lock_cache()
+    key = "mangopay2:wallet-lock:%s" % wallet_id
+    token = uuid.uuid4().hex
+    lease = getattr(settings, "MANGOPAY_WALLET_LOCK_LEASE", 60)
+    max_wait = getattr(settings, "MANGOPAY_WALLET_LOCK_WAIT", 30)
+
+    started = time.monotonic()
+    delay = 0.05
+    while not cache.add(key, token, lease):
+        waited = time.monotonic() - started
+        if waited >= max_wait:
+            raise WalletLockTimeout("Could not lock wallet %s within %s seconds" % (wallet_id, max_wait))
+        time.sleep(min(delay, max_wait - waited))
+        delay = min(delay * 2, 1)
+    wallet_lock_acquired.send(sender=None, wallet_id=wallet_id, waited=time.monotonic() - started)
+
+    try:
+        yield
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
@@ -1,19 +1,24 @@
 from urllib.request import urlopen
 import base64
+import hashlib
+from functools import lru_cache
 import jsonfield
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from decimal import Decimal, ROUND_FLOOR
 
 from django.conf import settings
 from django.core.files.storage import default_storage
+from django.core.signals import setting_changed
 from django.db import models
-from django.utils.timezone import utc
+from django.dispatch import receiver
+from django.utils.timezone import utc, now
 from mangopay.constants import DOCUMENTS_STATUS_CHOICES, DOCUMENTS_TYPE_CHOICES, LEGAL_USER_TYPE_CHOICES, \
     BANK_ACCOUNT_TYPE_CHOICES, DEPOSIT_CHOICES, STATUS_CHOICES, SECURE_MODE_CHOICES, \
-    PAYIN_PAYMENT_TYPE, USER_TYPE_CHOICES
+    PAYIN_PAYMENT_TYPE, USER_TYPE_CHOICES, VALIDITY_CHOICES
 from mangopay.resources import NaturalUser, LegalUser, Document, Page, BankAccount, Wallet, DirectPayIn, Money, \
-    BankWirePayIn, BankWirePayOut, Transfer, PayInRefund, CardRegistration
+    BankWirePayIn, BankWirePayOut, Transfer, PayIn, PayInRefund, CardRegistration, Card
 from mangopay.utils import Address
+from model_utils import FieldTracker
 from model_utils.models import TimeStampedModel
 
 from money.contrib.django.models.fields import MoneyField
@@ -25,12 +30,63 @@ from money import Money as PythonMoney
 
 import django_filepicker
 
+from .locks import wallet_lock
+from .payloads import is_final, entity_payload, entity_from_payload
+from .pages import sniff_format, declared_size, check_size, check_min_size, max_size, optimize_image
+
+CREATED = DOCUMENTS_STATUS_CHOICES.created
+VALIDATION_ASKED = DOCUMENTS_STATUS_CHOICES.validation_asked
+VALIDATED = DOCUMENTS_STATUS_CHOICES.validated
+REFUSED = DOCUMENTS_STATUS_CHOICES.refused
+
 
 def python_money_to_mangopay_money(python_money):
     amount = python_money.amount.quantize(Decimal('.01'), rounding=ROUND_FLOOR) * 100
     return Money(amount=int(amount), currency=str(python_money.currency))
 
 
+def expiration_date_as_date(expiration_date):
+    # Cards expire at the end of the month given as MMYY
+    try:
+        return date(2000 + int(expiration_date[2:]), int(expiration_date[:2]), 1)
+    except (TypeError, ValueError):
+        return None
+
+
+def save_changes(instance):
+    """
+    Write the tracked fields that changed since the instance was loaded or
+    last saved, and nothing if none did. New instances are saved in full.
+    Returns whether anything was written.
+    """
+    if instance.pk is None:
+        instance.save()
+        record_status_events(instance, [instance.pk])
+        return True
+    changed = list(instance.tracker.changed())
+    if changed:
+        instance.save(update_fields=changed)
+        if "status" in changed:
+            record_status_events(instance, [instance.pk])
+    return bool(changed)
+
+
+def record_status_events(instance, ids):
+    """
+    Append the status of ``instance`` to the status events of the objects
+    of its model with the given ids, in a single INSERT.
+    """
+    kind = STATUS_EVENT_KINDS.get(instance._meta.concrete_model)
+    if kind is None or instance.status is None:
+        return
+    observed = now()
+    MangoPayStatusEvent.objects.bulk_create([
+        MangoPayStatusEvent(kind=kind, object_id=id, status=instance.status,
+                            result_code=getattr(instance, "result_code", None), observed=observed)
+        for id in ids
+    ])
+
+
 def get_execution_date_as_datetime(mangopay_entity):
     execution_date = mangopay_entity.creation_date
     if execution_date:
@@ -42,7 +98,7 @@ def get_execution_date_as_datetime(mangopay_entity):
 
 
 class MangoPayUser(TimeStampedModel):
-    mangopay_id = models.PositiveIntegerField(null=True, blank=True)
+    mangopay_id = models.CharField(max_length=128, null=True, blank=True, unique=True)
     user = models.OneToOneField(settings.AUTH_USER_MODEL)
     type = models.CharField(max_length=10, choices=USER_TYPE_CHOICES)
     first_name = models.CharField(null=True, blank=True, max_length=99)
@@ -58,12 +114,13 @@ class MangoPayUser(TimeStampedModel):
     address = models.CharField(blank=True, null=True, max_length=254)
 
     objects = InheritanceManager()
+    tracker = FieldTracker(fields=["mangopay_id"])
 
     def create(self):
         mangopay_user = self.get_user()
         mangopay_user.save()
         self.mangopay_id = mangopay_user.get_pk()
-        self.save()
+        save_changes(self)
 
     def update(self):
         mangopay_user = self.get_user()
@@ -243,30 +300,39 @@ class MangoPayLegalUser(MangoPayUser):
 
 
 class MangoPayDocument(models.Model):
-    mangopay_id = models.PositiveIntegerField(null=True, blank=True)
+    mangopay_id = models.CharField(max_length=128, null=True, blank=True, unique=True)
     mangopay_user = models.ForeignKey(MangoPayUser, related_name="mangopay_documents")
     type = models.CharField(max_length=2, choices=DOCUMENTS_TYPE_CHOICES)
-    status = models.CharField(blank=True, null=True, max_length=1, choices=DOCUMENTS_STATUS_CHOICES)
+    status = models.CharField(blank=True, null=True, max_length=1, choices=DOCUMENTS_STATUS_CHOICES, db_index=True)
     refused_reason_message = models.CharField(null=True, blank=True, max_length=255)
     refused_reason_type = models.CharField(null=True, blank=True, max_length=255)
+    # When the validation was asked for and when the status was last
+    # scheduled to be polled, to poll the documents waiting for long less often
+    validation_asked_at = models.DateTimeField(null=True, blank=True)
+    polled_at = models.DateTimeField(null=True, blank=True)
+
+    tracker = FieldTracker(fields=["mangopay_id", "status", "refused_reason_message", "refused_reason_type",
+                                   "validation_asked_at", "polled_at"])
+
+    class Meta:
+        index_together = [("status", "polled_at")]
 
     def get_document(self):
-        user = self.mangopay_user.get_mango_user()
-        return Document(id=self.mangopay_id, user=user, type=self.type)
+        return Document(id=self.mangopay_id, user_id=self.mangopay_user.mangopay_id, type=self.type)
 
     def create(self):
         document = self.get_document()
         document.save()
         self.mangopay_id = document.get_pk()
         self.status = document.status
-        self.save()
+        save_changes(self)
 
     def get(self):
-        document = self.get_document()
+        document = Document.get(self.mangopay_id)
         self.refused_reason_type = document.refused_reason_type
         self.refused_reason_message = document.refused_reason_message
         self.status = document.status
-        self.save()
+        save_changes(self)
         return self
 
     def ask_for_validation(self):
@@ -275,7 +341,8 @@ class MangoPayDocument(models.Model):
             document.status = DOCUMENTS_STATUS_CHOICES.validation_asked
             document.save()
             self.status = document.status
-            self.save()
+            self.validation_asked_at = now()
+            save_changes(self)
         else:
             raise BaseException('Cannot ask for validation of a document not in the created state')
 
@@ -283,9 +350,18 @@ class MangoPayDocument(models.Model):
         return str(self.mangopay_id) + " " + str(self.status)
 
 
-# TODO: This needs to be reviewed
+PAGE_STORAGE_SETTINGS = ("MANGOPAY_PAGE_DEFAULT_STORAGE", "AWS_MEDIA_BUCKET_NAME", "AWS_MEDIA_CUSTOM_DOMAIN")
+
+# Read and encoded in multiples of 3 bytes so the base64 chunks concatenate
+PAGE_READ_CHUNK_SIZE = 3 * 256 * 1024
 
+
+@lru_cache(maxsize=None)
 def page_storage():
+    """
+    The storage the page files are read from, built once per process so
+    that every upload reuses the same S3 connection.
+    """
     if settings.MANGOPAY_PAGE_DEFAULT_STORAGE:
         return default_storage
     else:
@@ -298,6 +374,16 @@ def page_storage():
             custom_domain=settings.AWS_MEDIA_CUSTOM_DOMAIN)
 
 
+@receiver(setting_changed)
+def reset_page_storage(setting, **kwargs):
+    if setting in PAGE_STORAGE_SETTINGS:
+        page_storage.cache_clear()
+
+
+class RefusedPageError(Exception):
+    pass
+
+
 class MangoPayPage(models.Model):
     document = models.ForeignKey(MangoPayDocument, related_name="mangopay_pages")
     file = django_filepicker.models.FPUrlField(
@@ -306,23 +392,89 @@ class MangoPayPage(models.Model):
             'data-fp-store-path': 'mangopay_pages/',
             'data-fp-store-location': 'S3',
         })
+    # The key of the file in the page storage, read instead of ``file`` when set
+    storage_path = models.CharField(max_length=255, null=True, blank=True)
+    # SHA-256 and size of the bytes, set once the page has been sent
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    size = models.PositiveIntegerField(null=True, blank=True)
 
     def create(self):
-        document = self.document.get_document()
-        user = self.document.mangopay_user.get_user()
-        encoded_file = self._file_bytes().decode("utf-8")
-        page = Page(document=document, file=encoded_file, user=user)
-        page.save()
+        """
+        Send the page unless the same bytes were already sent for this
+        document. Raises ``RefusedPageError`` instead of sending again the
+        bytes of a page of a refused document of the same user and type.
+
+        Returns whether the page was sent.
+        """
+        encoded_file, content_hash, size = self._read()
+        sent = self._sent_with_same_content(content_hash)
+        duplicate = sent.filter(document_id=self.document_id).exists()
+        if not duplicate:
+            if sent.filter(document__status=REFUSED).exists():
+                raise RefusedPageError("Page %s has the content of a refused page" % self.id)
+            page = Page(document_id=self.document.mangopay_id, file=encoded_file.decode("utf-8"),
+                        user_id=self.document.mangopay_user.mangopay_id)
+            page.save()
+        self.content_hash = content_hash
+        self.size = size
+        self.save(update_fields=["content_hash", "size"])
+        return not duplicate
+
+    def _sent_with_same_content(self, content_hash):
+        return MangoPayPage.objects.filter(
+            content_hash=content_hash,
+            document__mangopay_user_id=self.document.mangopay_user_id,
+            document__type=self.document.type,
+        ).exclude(id=self.id)
+
+    def _open(self):
+        if self.storage_path:
+            return page_storage().open(self.storage_path, "rb")
+        return urlopen(self.file)
+
+    def _read(self):
+        """
+        The base64 encoded bytes to send with the SHA-256 of the file and
+        the size of the bytes, computed in a single pass over the file.
+
+        The format is checked on the first chunk and the size before the
+        whole file is read. Oversized images are recompressed when
+        ``MANGOPAY_PAGE_OPTIMIZE_IMAGES`` is set. Raises ``InvalidPageError``
+        for files MangoPay would refuse.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        chunks = []
+        page_format = None
+        source = self._open()
+        try:
+            while True:
+                chunk = source.read(PAGE_READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if page_format is None:
+                    page_format = sniff_format(chunk)
+                    check_size(declared_size(source), page_format)
+                size += len(chunk)
+                check_size(size, page_format)
+                digest.update(chunk)
+                chunks.append(chunk)
+        finally:
+            source.close()
+
+        check_min_size(size)
+        if size > max_size():
+            data = optimize_image(b"".join(chunks))
+            return base64.b64encode(data), digest.hexdigest(), len(data)
+        return b"".join(base64.b64encode(chunk) for chunk in chunks), digest.hexdigest(), size
 
     def _file_bytes(self):
-        response = urlopen(self.file)
-        bytes = base64.b64encode(response.read())
-        return bytes
+        return self._read()[0]
 
 
 class MangoPayBankAccount(models.Model):
     mangopay_user = models.ForeignKey(MangoPayUser, related_name="mangopay_bank_accounts")
-    mangopay_id = models.PositiveIntegerField(null=True, blank=True)
+    mangopay_id = models.CharField(max_length=128, null=True, blank=True, unique=True)
 
     address = models.CharField(max_length=254)
     account_type = models.CharField(
@@ -338,12 +490,14 @@ class MangoPayBankAccount(models.Model):
     aba = models.CharField(max_length=9, null=True, blank=True)
     deposit_account_type = models.CharField(max_length=8, choices=DEPOSIT_CHOICES, default=DEPOSIT_CHOICES.checking)
 
+    tracker = FieldTracker(fields=["mangopay_id"])
+
     def get_bank_account(self):
         bank_account = BankAccount(
             id=self.mangopay_id,
             owner_name=self.mangopay_user.user.get_full_name(),
             owner_address=Address(address_line_1=self.address),
-            user=self.mangopay_user.get_user(),
+            user_id=self.mangopay_user.mangopay_id,
             type=self.account_type
         )
 
@@ -364,24 +518,26 @@ class MangoPayBankAccount(models.Model):
         bank_account = self.get_bank_account()
         bank_account.save()
         self.mangopay_id = bank_account.get_pk()
-        self.save()
+        save_changes(self)
 
 
 class MangoPayWallet(models.Model):
-    mangopay_id = models.PositiveIntegerField(null=True, blank=True)
+    mangopay_id = models.CharField(max_length=128, null=True, blank=True, unique=True)
     mangopay_user = models.ForeignKey(MangoPayUser, related_name="mangopay_wallets")
     currency = models.CharField(max_length=3, default="EUR")
     description = models.CharField(max_length=255, blank=True, null=True)
 
+    tracker = FieldTracker(fields=["mangopay_id", "description"])
+
     def get_wallet(self):
-        user = self.mangopay_user.get_user()
-        return Wallet(id=self.mangopay_id, owners=[user], description=self.description, currency=self.currency)
+        return Wallet(id=self.mangopay_id, owners_ids=[self.mangopay_user.mangopay_id],
+                      description=self.description, currency=self.currency)
 
     def create(self):
         wallet = self.get_wallet()
         wallet.save()
         self.mangopay_id = wallet.get_pk()
-        self.save()
+        save_changes(self)
 
     def balance(self):
         wallet = self.get_wallet()
@@ -392,7 +548,7 @@ class MangoPayWallet(models.Model):
 
 
 class MangoPayPayIn(models.Model):
-    mangopay_id = models.PositiveIntegerField(null=True, blank=True)
+    mangopay_id = models.CharField(max_length=128, null=True, blank=True, unique=True)
     mangopay_user = models.ForeignKey(MangoPayUser, related_name="mangopay_payins")
     mangopay_wallet = models.ForeignKey(MangoPayWallet, related_name="mangopay_payins")
 
@@ -411,6 +567,8 @@ class MangoPayPayIn(models.Model):
     wire_reference = models.CharField(null=True, blank=True, max_length=50)
     mangopay_bank_account = jsonfield.JSONField(null=True, blank=True)
 
+    tracker = FieldTracker(fields=["mangopay_id", "execution_date", "status", "wire_reference"])
+
     def create(self):
         pay_in = self.get_pay_in()
         self.mangopay_id = pay_in.get_pk()
@@ -419,10 +577,14 @@ class MangoPayPayIn(models.Model):
     def get_pay_in(self):
         raise NotImplemented
 
+    def get(self):
+        pay_in = fetch_transaction(PayIn, self.mangopay_id)
+        return self._update(pay_in)
+
     def _update(self, pay_in):
         self.execution_date = get_execution_date_as_datetime(pay_in)
         self.status = pay_in.status
-        self.save()
+        save_changes(self)
         return self
 
 
@@ -432,14 +594,12 @@ class MangoPayDirectPayIn(MangoPayPayIn):
         proxy = True
 
     def get_pay_in(self):
-        author = self.mangopay_user.get_user()
-        credited_wallet = self.mangopay_wallet.get_wallet()
         card = '' # TODO: Add Card
         return DirectPayIn(
-            author=author,
+            author_id=self.mangopay_user.mangopay_id,
             debited_funds=python_money_to_mangopay_money(self.debited_funds),
             fees=python_money_to_mangopay_money(self.fees),
-            credited_wallet=credited_wallet,
+            credited_wallet_id=self.mangopay_wallet.mangopay_id,
             secure_mode_return_url=self.secure_mode_return_url,
             secure_mode=SECURE_MODE_CHOICES.default,
             payment_type=PAYIN_PAYMENT_TYPE.card
@@ -452,13 +612,11 @@ class MangoPayPayInBankWire(MangoPayPayIn):
         proxy = True
 
     def get_pay_in(self):
-        author = self.mangopay_user.get_user()
-        credited_wallet = self.mangopay_wallet.get_wallet()
         return BankWirePayIn(
-            author=author,
+            author_id=self.mangopay_user.mangopay_id,
             declared_debited_funds=python_money_to_mangopay_money(self.debited_funds),
             declared_fees=python_money_to_mangopay_money(self.fees),
-            credited_wallet=credited_wallet,
+            credited_wallet_id=self.mangopay_wallet.mangopay_id,
             payment_type=PAYIN_PAYMENT_TYPE.bank_wire
         )
 
@@ -468,7 +626,8 @@ class MangoPayPayInBankWire(MangoPayPayIn):
 
 
 class MangoPayPayOut(models.Model):
-    mangopay_id = models.PositiveIntegerField(null=True, blank=True)
+    # Not unique, the payouts coalesced into a batch get the id of the batch
+    mangopay_id = models.CharField(max_length=128, null=True, blank=True)
     mangopay_user = models.ForeignKey(MangoPayUser, related_name="mangopay_payouts")
     mangopay_wallet = models.ForeignKey(MangoPayWallet, related_name="mangopay_payouts")
     mangopay_bank_account = models.ForeignKey(MangoPayBankAccount, related_name="mangopay_payouts")
@@ -476,121 +635,265 @@ class MangoPayPayOut(models.Model):
     status = models.CharField(max_length=9, choices=STATUS_CHOICES, blank=True, null=True)
     debited_funds = MoneyField(default=0, default_currency="EUR", decimal_places=2, max_digits=12)
     fees = MoneyField(default=0, default_currency="EUR", decimal_places=2, max_digits=12)
+    # Left to BatchPayOuts to create, never created on its own
+    batchable = models.BooleanField(default=False)
 
-    def get_pay_out(self):
-        author = self.mangopay_user.get_user()
-        bank_account = self.mangopay_bank_account.get_bank_account()
+    tracker = FieldTracker(fields=["mangopay_id", "execution_date", "status"])
+
+    class Meta:
+        index_together = [("mangopay_id", "status")]
+
+    def get_pay_out(self, tag=None):
         return BankWirePayOut(
             id=self.mangopay_id,
-            author=author,
+            tag=tag or None,
+            author_id=self.mangopay_user.mangopay_id,
             debited_funds=python_money_to_mangopay_money(self.debited_funds),
             fees=python_money_to_mangopay_money(self.fees),
-            debited_wallet=self.mangopay_wallet,
-            bank_account=bank_account,
+            debited_wallet_id=self.mangopay_wallet.mangopay_id,
+            bank_account_id=self.mangopay_bank_account.mangopay_id,
             bank_wire_ref="John Doe's trousers"
         )
 
-    def create(self):
-        payout = self.get_pay_out()
-        payout.save()
+    def create(self, tag=None):
+        payout = self.get_pay_out(tag)
+        with wallet_lock(self.mangopay_wallet_id):
+            payout.save()
         self.mangopay_id = payout.get_pk()
         return self._update(payout)
 
+    def get(self):
+        pay_out = fetch_transaction(BankWirePayOut, self.mangopay_id)
+        return self._update(pay_out)
+
     def _update(self, pay_out):
         self.execution_date = get_execution_date_as_datetime(pay_out)
         self.status = pay_out.status
-        self.save()
+        if save_changes(self):
+            self._update_batched_pay_outs()
         return self
 
+    def _update_batched_pay_outs(self):
+        batched = MangoPayPayOut.objects.filter(mangopay_batch_item__batch=self).exclude(id=self.id)
+        record_status_events(self, list(batched.exclude(status=self.status).values_list("id", flat=True)))
+        batched.update(
+            mangopay_id=self.mangopay_id,
+            status=self.status,
+            execution_date=self.execution_date
+        )
+
+    def batched_pay_out_ids(self):
+        ids = list(self.mangopay_batch_items.values_list("pay_out_id", flat=True))
+        return ids or [self.id]
+
+
+class MangoPayPayOutBatchItem(models.Model):
+    # Links a payout to the payout it was coalesced into. A payout that had
+    # nothing to be coalesced with is its own batch.
+    batch = models.ForeignKey(MangoPayPayOut, related_name="mangopay_batch_items")
+    pay_out = models.OneToOneField(MangoPayPayOut, related_name="mangopay_batch_item")
+
 
 
 # TODO: This needs more investigations
 
 
+class MangoPayCardQuerySet(models.QuerySet):
+
+    def expiring(self, start, end):
+        """
+        Active cards expiring in the months from ``start`` up to, but not
+        including, ``end``.
+        """
+        return self.filter(is_active=True, expiration_month__gte=start, expiration_month__lt=end)
+
+
 class MangoPayCard(models.Model):
-    mangopay_id = models.PositiveIntegerField(null=True, blank=True)
+    mangopay_id = models.CharField(max_length=128, null=True, blank=True, unique=True)
     expiration_date = models.CharField(blank=True, null=True, max_length=4)
+    # First day of the month the card expires in, derived from expiration_date
+    expiration_month = models.DateField(blank=True, null=True, editable=False)
     alias = models.CharField(blank=True, null=True, max_length=16)
     is_active = models.BooleanField(default=False)
     is_valid = models.NullBooleanField()
 
+    INFO_FIELDS = ["expiration_date", "expiration_month", "alias", "is_active", "is_valid"]
+
+    objects = MangoPayCardQuerySet.as_manager()
+    tracker = FieldTracker(fields=["mangopay_id"] + INFO_FIELDS)
+
+    class Meta:
+        index_together = [("is_active", "expiration_month")]
+
+    def save(self, *args, **kwargs):
+        self.expiration_month = expiration_date_as_date(self.expiration_date)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "expiration_date" in update_fields:
+            kwargs["update_fields"] = set(update_fields) | {"expiration_month"}
+        super(MangoPayCard, self).save(*args, **kwargs)
+
     def request_card_info(self):
         if self.mangopay_id:
-            client = get_mangopay_api_client()
-            card = client.cards.Get(self.mangopay_id)
-            self.expiration_date = card.ExpirationDate
-            self.alias = card.Alias
-            self.is_active = card.Active
-            if card.Validity == "UNKNOWN":
-                self.is_valid = None
-            else:
-                self.is_valid = card.Validity == "VALID"
+            card = Card.get(self.mangopay_id)
+            self._update(card)
+            save_changes(self)
+
+    def _update(self, card):
+        """
+        Copy the info of the card entity, returning whether it changed.
+        """
+        if card.validity == VALIDITY_CHOICES.unknown:
+            is_valid = None
+        else:
+            is_valid = card.validity == VALIDITY_CHOICES.valid
+        info = (card.expiration_date, card.alias, bool(card.active), is_valid)
+        changed = info != (self.expiration_date, self.alias, self.is_active, self.is_valid)
+        self.expiration_date, self.alias, self.is_active, self.is_valid = info
+        self.expiration_month = expiration_date_as_date(self.expiration_date)
+        return changed
+
+
+class MangoPayCardRegistrationQuerySet(models.QuerySet):
+
+    def pooled(self, mangopay_user, currency):
+        max_age = getattr(settings, "MANGOPAY_CARD_REGISTRATION_POOL_MAX_AGE", 15 * 60)
+        return self.filter(mangopay_user=mangopay_user,
+                           currency=currency,
+                           mangopay_id__isnull=False,
+                           pooled_at__gte=now() - timedelta(seconds=max_age))
+
+    def stale(self, mangopay_user, currency):
+        max_age = getattr(settings, "MANGOPAY_CARD_REGISTRATION_POOL_MAX_AGE", 15 * 60)
+        return self.filter(mangopay_user=mangopay_user,
+                           currency=currency,
+                           pooled_at__lt=now() - timedelta(seconds=max_age))
+
+    def claim(self, mangopay_user, currency):
+        """
+        Take a registration out of the user's pool, or return ``None`` if
+        the pool is empty. Each candidate is claimed with one conditional
+        update so concurrent checkouts never get the same registration.
+        """
+        candidates = self.pooled(mangopay_user, currency).select_related("mangopay_card").order_by("pooled_at")
+        for card_registration in candidates[:5]:
+            if self.filter(id=card_registration.id, pooled_at__isnull=False).update(pooled_at=None):
+                card_registration.pooled_at = None
+                return card_registration
+        return None
 
 
 class MangoPayCardRegistration(models.Model):
-    mangopay_id = models.PositiveIntegerField(null=True, blank=True)
+    mangopay_id = models.CharField(max_length=128, null=True, blank=True, unique=True)
     mangopay_user = models.ForeignKey(MangoPayUser, related_name="mangopay_card_registrations")
     mangopay_card = models.OneToOneField(
         MangoPayCard, null=True, blank=True, related_name="mangopay_card_registration"
     )
+    currency = models.CharField(max_length=3, default="EUR")
+    preregistration_data = models.TextField(null=True, blank=True)
+    access_key = models.CharField(null=True, blank=True, max_length=255)
+    card_registration_url = models.URLField(null=True, blank=True, max_length=255)
+
+    # Set while the registration waits in the pool to be claimed at checkout
+    pooled_at = models.DateTimeField(null=True, blank=True)
 
-    def get_card_registration(self, currency='EUR'):
-        user = self.mangopay_user.get_user()
-        return CardRegistration(id=self.mangopay_id, user=user, currency=currency)
+    objects = MangoPayCardRegistrationQuerySet.as_manager()
+    tracker = FieldTracker(fields=["mangopay_id", "preregistration_data", "access_key", "card_registration_url"])
+
+    class Meta:
+        index_together = [("mangopay_user", "currency", "pooled_at")]
+
+    def get_card_registration(self, currency=None):
+        return CardRegistration(id=self.mangopay_id, user_id=self.mangopay_user.mangopay_id,
+                                currency=currency or self.currency)
 
     def create(self):
         card_registration = self.get_card_registration()
         card_registration.save()
         self.mangopay_id = card_registration.get_pk()
-        self.save()
+        self._set_preregistration_data(card_registration)
+        save_changes(self)
 
     def get_preregistration_data(self):
-        card_registration = self.get_card_registration()
+        if not self.preregistration_data:
+            card_registration = CardRegistration.get(self.mangopay_id)
+            self._set_preregistration_data(card_registration)
+            save_changes(self)
         preregistration_data = {
-            "preregistrationData": card_registration.preregistration_data,
-            "accessKey": card_registration.access_key,
-            "cardRegistrationURL": card_registration.card_registration_url
+            "preregistrationData": self.preregistration_data,
+            "accessKey": self.access_key,
+            "cardRegistrationURL": self.card_registration_url
         }
         return preregistration_data
 
+    def _set_preregistration_data(self, card_registration):
+        self.preregistration_data = card_registration.preregistration_data
+        self.access_key = card_registration.access_key
+        self.card_registration_url = card_registration.card_registration_url
+
     def save_mangopay_card_id(self, mangopay_card_id):
         self.mangopay_card.mangopay_id = mangopay_card_id
-        self.mangopay_card.save()
+        save_changes(self.mangopay_card)
 
     def save(self, *args, **kwargs):
         if not self.mangopay_card:
             mangopay_card = MangoPayCard()
             mangopay_card.save()
             self.mangopay_card = mangopay_card
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = set(kwargs["update_fields"]) | {"mangopay_card"}
         super(MangoPayCardRegistration, self).save(*args, **kwargs)
 
 
 class MangoPayInRefund(models.Model):
-    mangopay_id = models.PositiveIntegerField(null=True, blank=True)
+    mangopay_id = models.CharField(max_length=128, null=True, blank=True, unique=True)
     mangopay_user = models.ForeignKey(MangoPayUser, related_name="mangopay_refunds")
     mangopay_pay_in = models.ForeignKey(MangoPayPayIn, related_name="mangopay_refunds")
     execution_date = models.DateTimeField(blank=True, null=True)
     status = models.CharField(max_length=9, choices=STATUS_CHOICES, blank=True, null=True)
     result_code = models.CharField(null=True, blank=True, max_length=6)
 
-    def create(self):
-        author = self.mangopay_user.get_user()
-        payin = self.mangopay_pay_in.get_pay_in()
+    # Partial refunds only, the pay in is refunded in full when not set
+    debited_funds = MoneyField(null=True, blank=True, default=None, default_currency="EUR", decimal_places=2,
+                               max_digits=12)
+    fees = MoneyField(null=True, blank=True, default=None, default_currency="EUR", decimal_places=2,
+                      max_digits=12)
+
+    tracker = FieldTracker(fields=["mangopay_id", "execution_date", "status", "result_code"])
+
+    def get_refund(self):
+        # The refund only needs the remote ids, there is no need to build
+        # the author and the pay in
         payin_refund = PayInRefund(
-            author=author,
-            payin=payin,
+            author_id=self.mangopay_user.mangopay_id,
+            payin_id=self.mangopay_pay_in.mangopay_id,
         )
-        payin_refund.save()
+        if self.debited_funds is not None:
+            fees = self.fees if self.fees is not None else PythonMoney(0, self.debited_funds.currency)
+            payin_refund.debited_funds = python_money_to_mangopay_money(self.debited_funds)
+            payin_refund.fees = python_money_to_mangopay_money(fees)
+        return payin_refund
+
+    def create(self):
+        payin_refund = self.get_refund()
+        with wallet_lock(self.mangopay_pay_in.mangopay_wallet_id):
+            payin_refund.save()
         self.mangopay_id = payin_refund.get_pk()
+        return self._update(payin_refund)
+
+    def get(self):
+        payin_refund = fetch_transaction(PayInRefund, self.mangopay_id)
+        return self._update(payin_refund)
+
+    def _update(self, payin_refund):
         self.status = payin_refund.status
         self.result_code = payin_refund.result_code
         self.execution_date = get_execution_date_as_datetime(payin_refund)
-        self.save()
+        save_changes(self)
         return self
 
 
 class MangoPayTransfer(models.Model):
-    mangopay_id = models.PositiveIntegerField(null=True, blank=True)
+    mangopay_id = models.CharField(max_length=128, null=True, blank=True, unique=True)
     mangopay_debited_wallet = models.ForeignKey(MangoPayWallet, related_name="mangopay_debited_wallets")
     mangopay_credited_wallet = models.ForeignKey(MangoPayWallet, related_name="mangopay_credited_wallets")
     debited_funds = MoneyField(default=0, default_currency="EUR", decimal_places=2, max_digits=12)
@@ -599,31 +902,108 @@ class MangoPayTransfer(models.Model):
     status = models.CharField(max_length=9, choices=STATUS_CHOICES, blank=True, null=True)
     result_code = models.CharField(null=True, blank=True, max_length=6)
 
-    def get_transfer(self):
-        author = self.mangopay_debited_wallet.mangopay_user.get_user()
-        debited_wallet = self.mangopay_debited_wallet.get_wallet()
-
-        credited_user = self.mangopay_credited_wallet.mangopay_user.get_user()
-        credited_wallet = self.mangopay_credited_wallet.get_wallet()
+    tracker = FieldTracker(fields=["mangopay_id", "execution_date", "status", "result_code"])
 
+    def get_transfer(self):
         return Transfer(
             id=self.mangopay_id,
-            author=author,
-            credited_user=credited_user,
+            author_id=self.mangopay_debited_wallet.mangopay_user.mangopay_id,
+            credited_user_id=self.mangopay_credited_wallet.mangopay_user.mangopay_id,
             debited_funds=python_money_to_mangopay_money(self.debited_funds),
             fees=python_money_to_mangopay_money(self.fees),
-            debited_wallet=debited_wallet,
-            credited_wallet=credited_wallet
+            debited_wallet_id=self.mangopay_debited_wallet.mangopay_id,
+            credited_wallet_id=self.mangopay_credited_wallet.mangopay_id
         )
 
     def create(self):
         transfer = self.get_transfer()
-        transfer.save()
+        with wallet_lock(self.mangopay_debited_wallet_id):
+            transfer.save()
         self.mangopay_id = transfer.get_pk()
         self._update(transfer)
 
+    def get(self):
+        transfer = fetch_transaction(Transfer, self.mangopay_id)
+        self._update(transfer)
+        return self
+
     def _update(self, transfer):
         self.status = transfer.status
         self.result_code = transfer.result_code
         self.execution_date = get_execution_date_as_datetime(transfer)
-        self.save()
+        save_changes(self)
+
+
+class MangoPayImportCheckpoint(models.Model):
+    # How far an import of remote objects got, to resume it from there
+    name = models.CharField(max_length=50, unique=True)
+    position = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+
+class MangoPayStatusEvent(models.Model):
+    # Append-only: a status observed for a transaction or a document, added
+    # every time it changes
+    PAY_IN, PAY_OUT, TRANSFER, REFUND, DOCUMENT = range(1, 6)
+    KIND_CHOICES = (
+        (PAY_IN, "Pay in"),
+        (PAY_OUT, "Payout"),
+        (TRANSFER, "Transfer"),
+        (REFUND, "Refund"),
+        (DOCUMENT, "Document"),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    status = models.CharField(max_length=20)
+    result_code = models.CharField(max_length=6, null=True, blank=True)
+    observed = models.DateTimeField(default=now)
+
+    class Meta:
+        index_together = [("kind", "object_id", "observed")]
+
+
+STATUS_EVENT_KINDS = {
+    MangoPayPayIn: MangoPayStatusEvent.PAY_IN,
+    MangoPayPayOut: MangoPayStatusEvent.PAY_OUT,
+    MangoPayTransfer: MangoPayStatusEvent.TRANSFER,
+    MangoPayInRefund: MangoPayStatusEvent.REFUND,
+    MangoPayDocument: MangoPayStatusEvent.DOCUMENT,
+}
+
+
+class MangoPayOutboxEntry(models.Model):
+    # A task recorded in the transaction of the rows it works on, sent by
+    # the relay once that transaction committed
+    task = models.CharField(max_length=255)
+    kwargs = jsonfield.JSONField(default=dict)
+    created = models.DateTimeField(auto_now_add=True)
+
+
+class MangoPayTransactionPayload(models.Model):
+    # The remote payload of a transaction in a final status, which never
+    # changes again and so is not fetched again
+    mangopay_id = models.CharField(max_length=128, unique=True)
+    resource = models.CharField(max_length=50)
+    payload = jsonfield.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    def entity(self):
+        return entity_from_payload(self.resource, self.payload)
+
+
+def fetch_transaction(resource, mangopay_id):
+    """
+    Get a transaction from its stored payload if it is final, otherwise
+    from the API, storing its payload once it is final.
+    """
+    stored = MangoPayTransactionPayload.objects.filter(mangopay_id=mangopay_id).first()
+    if stored is not None:
+        return stored.entity()
+    entity = resource.get(mangopay_id)
+    if is_final(entity):
+        MangoPayTransactionPayload.objects.get_or_create(
+            mangopay_id=str(entity.get_pk()),
+            defaults={"resource": type(entity).__name__, "payload": entity_payload(entity)})
+    return entity
@@ -0,0 +1,46 @@
+import logging
+
+from django.db import transaction
+
+from .models import MangoPayOutboxEntry
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(task, **kwargs):
+    """
+    Record that ``task`` is to be sent with ``kwargs``. The entry is
+    written in the current transaction, so the task is only sent if the
+    rows it works on were committed, and nothing is published to the
+    broker during the request.
+    """
+    return MangoPayOutboxEntry.objects.create(task=task.name, kwargs=kwargs)
+
+
+def relay_outbox(tasks, batch_size=100):
+    """
+    Send the oldest entries of the outbox to the broker and delete them.
+    ``tasks`` is the task registry of the Celery app. Entries locked by
+    another relay are skipped. Returns the number of entries handled.
+    """
+    error = None
+    with transaction.atomic():
+        entries = list(MangoPayOutboxEntry.objects.select_for_update(skip_locked=True).order_by("id")[:batch_size])
+        done = []
+        for entry in entries:
+            task = tasks.get(entry.task)
+            if task is None:
+                logger.error("Dropping outbox entry %s for the unknown task %s", entry.id, entry.task)
+            else:
+                try:
+                    task.apply_async(kwargs=entry.kwargs)
+                except Exception as exc:
+                    error = exc
+                    break
+            done.append(entry.id)
+        # The entries sent before a publish failed are not sent again: they
+        # are deleted and committed before the error is raised
+        MangoPayOutboxEntry.objects.filter(id__in=done).delete()
+    if error is not None:
+        raise error
+    return len(done)
@@ -0,0 +1,93 @@
+from io import BytesIO
+
+from django.conf import settings
+
+# Leading bytes of the formats MangoPay accepts for KYC pages
+SIGNATURES = (
+    (b"%PDF-", "pdf"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+IMAGE_FORMATS = ("jpeg", "png", "gif")
+
+
+class InvalidPageError(Exception):
+    pass
+
+
+def min_size():
+    return getattr(settings, "MANGOPAY_PAGE_MIN_SIZE", 32 * 1024)
+
+
+def max_size():
+    return getattr(settings, "MANGOPAY_PAGE_MAX_SIZE", 10 * 1024 * 1024)
+
+
+def max_source_size():
+    # Oversized images are read in memory to be recompressed, up to this size
+    return getattr(settings, "MANGOPAY_PAGE_MAX_SOURCE_SIZE", 5 * max_size())
+
+
+def sniff_format(head):
+    for signature, page_format in SIGNATURES:
+        if head.startswith(signature):
+            return page_format
+    raise InvalidPageError("Unsupported page format")
+
+
+def declared_size(source):
+    """
+    The size of an opened file when it is known without reading it: the
+    size of a storage file or the ``Content-Length`` of a response.
+    """
+    size = getattr(source, "size", None)
+    if size is None and hasattr(source, "headers"):
+        size = source.headers.get("Content-Length")
+    return int(size) if size is not None else None
+
+
+def can_optimize(page_format):
+    return getattr(settings, "MANGOPAY_PAGE_OPTIMIZE_IMAGES", False) and page_format in IMAGE_FORMATS
+
+
+def check_size(size, page_format=None):
+    if size is None:
+        return
+    limit = max_source_size() if can_optimize(page_format) else max_size()
+    if size > limit:
+        raise InvalidPageError("Page of %d bytes is over the limit of %d bytes" % (size, limit))
+
+
+def check_min_size(size):
+    if size < min_size():
+        raise InvalidPageError("Page of %d bytes is under the limit of %d bytes" % (size, min_size()))
+
+
+def optimize_image(data):
+    """
+    Downsample and recompress an image as JPEG, lowering the quality from
+    ``MANGOPAY_PAGE_MAX_QUALITY`` to ``MANGOPAY_PAGE_MIN_QUALITY`` until it
+    fits in ``MANGOPAY_PAGE_MAX_SIZE``. Needs Pillow.
+    """
+    from PIL import Image
+
+    dimension = getattr(settings, "MANGOPAY_PAGE_MAX_DIMENSION", 2480)
+    image = Image.open(BytesIO(data))
+    # Lets JPEG images be decoded already downscaled
+    image.draft("RGB", (dimension, dimension))
+    image.thumbnail((dimension, dimension))
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    quality = getattr(settings, "MANGOPAY_PAGE_MAX_QUALITY", 85)
+    lowest = getattr(settings, "MANGOPAY_PAGE_MIN_QUALITY", 60)
+    while True:
+        output = BytesIO()
+        image.save(output, "JPEG", quality=quality, optimize=True)
+        if output.tell() <= max_size():
+            return output.getvalue()
+        if quality <= lowest:
+            raise InvalidPageError("Page is over the limit of %d bytes at the lowest quality" % max_size())
+        quality = max(quality - 10, lowest)
@@ -0,0 +1,28 @@
+from mangopay import resources
+from mangopay.constants import STATUS_CHOICES
+
+# A transaction in one of these statuses never changes remotely again
+FINAL_STATUSES = (STATUS_CHOICES.succeeded, STATUS_CHOICES.failed)
+
+
+def is_final(entity):
+    return entity.get_pk() is not None and entity.status in FINAL_STATUSES
+
+
+def entity_payload(entity):
+    """
+    The fields of an SDK entity as the API sends them, so the entity can be
+    built again by ``entity_from_payload``.
+    """
+    payload = {}
+    for api_name, field_name in entity._meta.api_names.items():
+        value = getattr(entity, field_name, None)
+        if value is not None:
+            payload[api_name] = entity._meta.get_field_by_name(field_name).api_value(value)
+    return payload
+
+
+def entity_from_payload(resource, payload):
+    model = getattr(resources, resource)
+    model = getattr(model, "cast", lambda result: model)(payload)
+    return model(**dict(model.select().parse_result(payload, model)))
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+
+from django.db import transaction
+from mangopay.constants import STATUS_CHOICES
+
+from .models import MangoPayPayIn, MangoPayInRefund
+
+
+def refundable_pay_ins(pay_in_ids):
+    """
+    The succeeded pay ins among ``pay_in_ids`` that have no refund yet,
+    other than failed ones.
+    """
+    refunded = MangoPayInRefund.objects.exclude(status=STATUS_CHOICES.failed)
+    return MangoPayPayIn.objects.filter(
+        id__in=pay_in_ids, mangopay_id__isnull=False, status=STATUS_CHOICES.succeeded
+    ).exclude(
+        id__in=refunded.values("mangopay_pay_in_id")
+    )
+
+
+def create_refunds(pay_in_ids):
+    """
+    Add a full ``MangoPayInRefund`` for each refundable pay in. Returns the
+    ids of the refunds to create remotely grouped by the wallet they debit.
+    """
+    with transaction.atomic():
+        pay_ins = list(refundable_pay_ins(pay_in_ids).select_for_update().order_by("id").values_list(
+            "id", "mangopay_user_id", "mangopay_wallet_id"))
+        MangoPayInRefund.objects.bulk_create(
+            MangoPayInRefund(mangopay_pay_in_id=pay_in_id, mangopay_user_id=mangopay_user_id)
+            for pay_in_id, mangopay_user_id, mangopay_wallet_id in pay_ins)
+
+        wallets = dict((pay_in_id, wallet_id) for pay_in_id, user_id, wallet_id in pay_ins)
+        refunds = MangoPayInRefund.objects.filter(
+            mangopay_pay_in_id__in=wallets, mangopay_id__isnull=True, status__isnull=True
+        ).order_by("id").values_list("id", "mangopay_pay_in_id")
+
+        by_wallet = OrderedDict()
+        for refund_id, pay_in_id in refunds:
+            by_wallet.setdefault(wallets[pay_in_id], []).append(refund_id)
+    return list(by_wallet.values())
+
+
+def partition(groups, size):
+    """
+    Spread ``groups`` of ids over at most ``size`` lists, keeping each group
+    in a single list and balancing the lengths of the lists.
+    """
+    lists = [[] for i in range(min(size, len(groups)))]
+    for group in sorted(groups, key=len, reverse=True):
+        min(lists, key=len).extend(group)
+    return lists
@@ -0,0 +1,116 @@
+"""
+Online migration of the ``mangopay_id`` columns from integers to strings.
+
+MangoPay ids are opaque strings that do not fit in an integer column. On
+PostgreSQL ``migrate_remote_ids`` moves each table to a ``varchar`` column
+without rewriting it under a lock:
+
+1. a nullable ``mangopay_id_new`` column is added, and kept in sync with
+   ``mangopay_id`` by a trigger while the migration runs,
+2. the existing ids are copied over in chunks, one short transaction each,
+3. the ``mangopay_id`` indexes of ``mangopay2.indexes`` are built
+   concurrently on the new column,
+4. the old column is dropped and the new one renamed in one short
+   transaction.
+
+Every step can be run again, so an interrupted migration is resumed by
+running it again. On other databases the columns are altered in place.
+"""
+from django.db import transaction
+
+from .indexes import INDEXES, index_name, create_index_sql
+from .models import MangoPayTransactionPayload
+
+NEW_COLUMN = "mangopay_id_new"
+
+# Created with a string remote id, so there is nothing to migrate
+STRING_REMOTE_ID_MODELS = (MangoPayTransactionPayload,)
+
+COPY_FUNCTION = """
+CREATE OR REPLACE FUNCTION mangopay2_copy_remote_id() RETURNS trigger AS $$
+BEGIN
+    NEW.mangopay_id_new := NEW.mangopay_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def remote_id_models():
+    # Multi-table children share the column of their parent
+    models = dict.fromkeys(
+        model._meta.get_field("mangopay_id").model for model, fields, unique in INDEXES if "mangopay_id" in fields)
+    return [model for model in models if model not in STRING_REMOTE_ID_MODELS]
+
+
+def _columns_type(cursor, table):
+    cursor.execute(
+        "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = %s", [table])
+    return dict(cursor.fetchall())
+
+
+def _copy_remote_ids(connection, table, pk, chunk_size):
+    last = None
+    while True:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE "{table}" SET "{new}" = "mangopay_id" WHERE "{pk}" IN ('
+                'SELECT "{pk}" FROM "{table}" WHERE "mangopay_id" IS NOT NULL AND "{new}" IS NULL {after}'
+                'ORDER BY "{pk}" LIMIT %s) RETURNING "{pk}"'.format(
+                    table=table, new=NEW_COLUMN, pk=pk, after='AND "%s" > %%s ' % pk if last is not None else ""),
+                [last, chunk_size] if last is not None else [chunk_size])
+            pks = [row[0] for row in cursor.fetchall()]
+        if not pks:
+            return
+        last = max(pks)
+
+
+def _migrate_table(connection, model, chunk_size):
+    table = model._meta.db_table
+    pk = model._meta.pk.column
+    trigger = "%s_copy_remote_id" % table
+    with connection.cursor() as cursor:
+        columns = _columns_type(cursor, table)
+        if NEW_COLUMN not in columns and columns["mangopay_id"] == "character varying":
+            return
+
+        cursor.execute('ALTER TABLE "%s" ADD COLUMN IF NOT EXISTS "%s" varchar(128) NULL' % (table, NEW_COLUMN))
+        cursor.execute(COPY_FUNCTION)
+        cursor.execute('DROP TRIGGER IF EXISTS "%s" ON "%s"' % (trigger, table))
+        cursor.execute('CREATE TRIGGER "%s" BEFORE INSERT OR UPDATE ON "%s" FOR EACH ROW '
+                       'EXECUTE PROCEDURE mangopay2_copy_remote_id()' % (trigger, table))
+
+    _copy_remote_ids(connection, table, pk, chunk_size)
+
+    renames = []
+    with connection.cursor() as cursor:
+        for indexed_model, fields, unique in INDEXES:
+            if indexed_model is not model or "mangopay_id" not in fields:
+                continue
+            columns = [model._meta.get_field(name).column for name in fields]
+            new_columns = [NEW_COLUMN if column == "mangopay_id" else column for column in columns]
+            name = index_name(table, new_columns, unique)
+            cursor.execute(create_index_sql(table, new_columns, name, unique))
+            renames.append((name, index_name(table, columns, unique)))
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute('DROP TRIGGER "%s" ON "%s"' % (trigger, table))
+        cursor.execute('ALTER TABLE "%s" DROP COLUMN "mangopay_id"' % table)
+        cursor.execute('ALTER TABLE "%s" RENAME COLUMN "%s" TO "mangopay_id"' % (table, NEW_COLUMN))
+        for name, new_name in renames:
+            cursor.execute('ALTER INDEX "%s" RENAME TO "%s"' % (name, new_name))
+
+
+def migrate_remote_ids(apps, schema_editor, chunk_size=10000):
+    """
+    Move every ``mangopay_id`` column to a string. Use it as a ``RunPython``
+    operation in a non-atomic migration.
+    """
+    connection = schema_editor.connection
+    for model in remote_id_models():
+        if connection.vendor == "postgresql":
+            _migrate_table(connection, model, chunk_size)
+        else:
+            old_model = apps.get_model(model._meta.app_label, model._meta.object_name)
+            schema_editor.alter_field(
+                old_model, old_model._meta.get_field("mangopay_id"), model._meta.get_field("mangopay_id"))
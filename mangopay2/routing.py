@@ -0,0 +1,67 @@
+from django.conf import settings
+from kombu import Queue
+
+INTERACTIVE_QUEUE = "mangopay_interactive"
+BULK_QUEUE = "mangopay_bulk"
+
+# Operations a user may be waiting on go to the interactive queue, backfills,
+# polling and follow-ups to the bulk queue.
+DEFAULT_TASK_QUEUES = {
+    "create_mangopay_user": INTERACTIVE_QUEUE,
+    "update_mangopay_user": INTERACTIVE_QUEUE,
+    "create_mangopay_bank_account": INTERACTIVE_QUEUE,
+    "create_mangopay_wallet": INTERACTIVE_QUEUE,
+    "create_mangopay_transfer": INTERACTIVE_QUEUE,
+    "create_mangopay_refund": INTERACTIVE_QUEUE,
+    "fill_card_registration_pool": INTERACTIVE_QUEUE,
+    "RelayOutbox": INTERACTIVE_QUEUE,
+    "import_mangopay_users": BULK_QUEUE,
+    "create_mangopay_document_and_pages_and_ask_for_validation": BULK_QUEUE,
+    "update_document_status": BULK_QUEUE,
+    "ask_for_document_validation": BULK_QUEUE,
+    "UpdateDocumentsStatus": BULK_QUEUE,
+    "create_mangopay_pay_out": BULK_QUEUE,
+    "update_mangopay_pay_out": BULK_QUEUE,
+    "BatchPayOuts": BULK_QUEUE,
+    "refresh_mangopay_cards": BULK_QUEUE,
+    "RefreshCards": BULK_QUEUE,
+    "ScanExpiringCards": BULK_QUEUE,
+    "CreateStatusEventPartitions": BULK_QUEUE,
+    "create_mangopay_users_chunk": BULK_QUEUE,
+    "create_mangopay_bank_accounts_chunk": BULK_QUEUE,
+    "create_mangopay_documents_chunk": BULK_QUEUE,
+    "create_mangopay_wallets_chunk": BULK_QUEUE,
+    "create_mangopay_pay_outs_chunk": BULK_QUEUE,
+    "create_mangopay_transfers_chunk": BULK_QUEUE,
+    "create_mangopay_refunds_chunk": BULK_QUEUE,
+    "update_documents_status_chunk": BULK_QUEUE,
+    "ask_for_documents_validation_chunk": BULK_QUEUE,
+    "update_mangopay_pay_outs_chunk": BULK_QUEUE,
+}
+
+DEFAULT_QUEUE_PRIORITIES = {
+    INTERACTIVE_QUEUE: 9,
+    BULK_QUEUE: 1,
+}
+
+
+def task_queue(name):
+    return getattr(settings, "MANGOPAY_TASK_QUEUES", {}).get(name, DEFAULT_TASK_QUEUES[name])
+
+
+def task_priority(name):
+    priorities = dict(DEFAULT_QUEUE_PRIORITIES, **getattr(settings, "MANGOPAY_QUEUE_PRIORITIES", {}))
+    return priorities.get(task_queue(name))
+
+
+def task_routing(name):
+    return {"queue": task_queue(name), "priority": task_priority(name)}
+
+
+def task_queues(max_priority=10):
+    """
+    The queues the tasks are routed to, for ``CELERY_TASK_QUEUES``. They
+    are declared with a maximum priority so brokers honour task priorities.
+    """
+    names = sorted(set(task_queue(name) for name in DEFAULT_TASK_QUEUES))
+    return [Queue(name, routing_key=name, queue_arguments={"x-max-priority": max_priority}) for name in names]
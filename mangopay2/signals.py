@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Sent once a wallet lock is held, with the seconds spent waiting for it.
+wallet_lock_acquired = Signal(providing_args=["wallet_id", "waited"])
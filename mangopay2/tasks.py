@@ -1,128 +1,555 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
 
+from celery import group
 from celery.task import task
 from celery.task import PeriodicTask
+from celery.exceptions import Retry
 from celery.schedules import crontab
 from celery.utils.log import get_task_logger
+from mangopay.constants import DOCUMENTS_STATUS_CHOICES
 from mangopay.exceptions import APIError
 
-from .models import (
-    MangoPayUser, MangoPayBankAccount, MangoPayDocument, MangoPayWallet, MangoPayPayOut, MangoPayTransfer
-)
+from . import loaders
+from .batching import CREATABLE, NOT_COALESCED, batch_pending_pay_outs
+from .calendars import calendar_for
+from .client import CircuitOpenError
+from .documents import documents_due, spread_countdowns
+from .events import create_partitions
+from .cards import mangopay_user_ids_with_cards_to_refresh, refresh_cards, expiring_card_ids
+from .importers import import_users
+from .locks import WalletLockTimeout
+from .models import MangoPayUser, MangoPayDocument, MangoPayCard, MangoPayCardRegistration, RefusedPageError
+from .pages import InvalidPageError
+from .payloads import FINAL_STATUSES
+from .outbox import relay_outbox
+from .refunds import create_refunds, partition
+from .routing import task_queue, task_priority, task_routing
+
+VALIDATION_ASKED = DOCUMENTS_STATUS_CHOICES.validation_asked
+
+CHUNK_CREATED = "created"
+CHUNK_UPDATED = "updated"
+CHUNK_SKIPPED = "skipped"
+CHUNK_RETRYING = "retrying"
+CHUNK_FAILED = "failed"
+CHUNK_REFUSED = "refused"
+CHUNK_OUTCOMES = (CHUNK_CREATED, CHUNK_UPDATED, CHUNK_SKIPPED, CHUNK_RETRYING, CHUNK_FAILED, CHUNK_REFUSED)
+# Not an id: the number of bytes of pages a chunk of documents did not send again
+CHUNK_BYTES_SAVED = "bytes_saved"
 
 logger = get_task_logger(__name__)
 
 
-def next_weekday():
-    def maybe_add_day(date):
-        if datetime.weekday(date) >= 5:
-            date += timedelta(days=1)
-            return maybe_add_day(date)
+def pay_out_follow_up(payout):
+    """
+    When to check a payout again: its slot in the business hours of its
+    currency, at least an hour from now. The slots of the payouts are
+    spread over business hours.
+    """
+    calendar = calendar_for(payout.debited_funds.currency)
+    return calendar.next_slot(now(), payout.id)
+
+
+def _retry(task, kwargs, exc):
+    """
+    The exception retrying ``task`` with ``kwargs`` after ``exc``. While a
+    circuit is open the task is sent again once it may be closed, without
+    spending the task's retries, so an outage longer than they last does
+    not fail the tasks the circuit breaker protects.
+    """
+    if isinstance(exc, CircuitOpenError):
+        task.apply_async(args=(), kwargs=kwargs, countdown=exc.retry_after, retries=task.request.retries)
+        return Retry(exc=exc, when=exc.retry_after)
+    return task.retry(args=(), kwargs=kwargs, exc=exc)
+
+
+def chunk_queryset(queryset, size=100):
+    """
+    Yield the primary keys of ``queryset`` in lists of at most ``size``,
+    paging on the primary key so large tables are never offset-scanned.
+    """
+    pks = queryset.order_by("pk").values_list("pk", flat=True)
+    last = None
+    while True:
+        page = pks if last is None else pks.filter(pk__gt=last)
+        chunk = list(page[:size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+
+
+def _create_chunk(queryset, ids, create, retry, done=CHUNK_CREATED, commit_each=False):
+    """
+    Run ``create`` on every row of ``queryset`` whose id is in ``ids``
+    within one transaction, using a savepoint per row. Rows whose API call
+    failed are passed to ``retry`` once the chunk is committed, or count as
+    failed if ``retry`` is None.
+
+    With ``commit_each`` every row is committed on its own instead, so the
+    remote ids of the rows already created are kept if the chunk is
+    interrupted. Chunks moving money use it, since creating a row again
+    would move the money twice.
+
+    Returns the outcome for each id: the one returned by ``create`` if it
+    returned one of ``CHUNK_OUTCOMES``, or ``done``.
+    """
+    if commit_each:
+        return _sync_rows(queryset, ids, create, retry, done)
+    with transaction.atomic():
+        return _sync_rows(queryset, ids, create, retry, done)
+
+
+def _sync_rows(queryset, ids, create, retry, done):
+    outcomes = {}
+    instances = queryset.in_bulk(ids)
+    for id in ids:
+        instance = instances.get(id)
+        if instance is None:
+            outcomes[id] = CHUNK_SKIPPED
+            continue
+        try:
+            with transaction.atomic():
+                outcome = create(instance)
+        except (APIError, WalletLockTimeout) as exc:
+            if retry is None:
+                logger.warning("Syncing %r failed: %s", instance, exc)
+                outcomes[id] = CHUNK_FAILED
+                continue
+            logger.warning("Syncing %r failed, retrying it on its own: %s", instance, exc)
+            transaction.on_commit(lambda instance=instance: retry(instance))
+            outcomes[id] = CHUNK_RETRYING
+        except Exception:
+            logger.exception("Syncing %r failed", instance)
+            outcomes[id] = CHUNK_FAILED
         else:
-            return date
-    return maybe_add_day(datetime.now() + timedelta(days=1))
+            outcomes[id] = outcome if isinstance(outcome, str) and outcome in CHUNK_OUTCOMES else done
+    return outcomes
 
 
-@task
+@task(**task_routing("create_mangopay_user"))
 def create_mangopay_user(id):
     try:
-        MangoPayUser.objects.select_subclasses().get(id=id, mangopay_id__isnull=True).create()
+        loaders.mangopay_users().get(id=id, mangopay_id__isnull=True).create()
+    except APIError as exc:
+        raise _retry(create_mangopay_user, {"id": id}, exc)
+
+
+@task(**task_routing("import_mangopay_users"))
+def import_mangopay_users():
+    try:
+        return import_users()
     except APIError as exc:
-        raise create_mangopay_user.retry(args=(), kwargs={"id": id}, exc=exc)
+        raise _retry(import_mangopay_users, {}, exc)
 
 
-@task
+@task(**task_routing("update_mangopay_user"))
 def update_mangopay_user(id):
     try:
-        MangoPayUser.objects.select_subclasses().get(id=id, mangopay_id__isnull=False).update()
+        loaders.mangopay_users().get(id=id, mangopay_id__isnull=False).update()
     except APIError as exc:
-        raise update_mangopay_user.retry(args=(), kwargs={"id": id}, exc=exc)
+        raise _retry(update_mangopay_user, {"id": id}, exc)
 
 
-@task
+@task(**task_routing("create_mangopay_bank_account"))
 def create_mangopay_bank_account(id):
     try:
-        MangoPayBankAccount.objects.get(id=id, mangopay_id__isnull=True).create()
+        loaders.bank_accounts().get(id=id, mangopay_id__isnull=True).create()
     except APIError as exc:
-        raise create_mangopay_bank_account.retry(args=(), kwargs={"id": id}, exc=exc)
+        raise _retry(create_mangopay_bank_account, {"id": id}, exc)
 
 
-@task
+@task(**task_routing("create_mangopay_document_and_pages_and_ask_for_validation"))
 def create_mangopay_document_and_pages_and_ask_for_validation(id):
-    document = MangoPayDocument.objects.get(id=id, mangopay_id__isnull=True, type__isnull=False)
+    document = loaders.documents().prefetch_related("mangopay_pages").get(
+        id=id, mangopay_id__isnull=True, type__isnull=False)
     try:
         document.create()
     except APIError as exc:
-        raise create_mangopay_document_and_pages_and_ask_for_validation.retry(args=(), kwargs={"id": id}, exc=exc)
-    for page in document.mangopay_pages.all():
-        page.create()
-    document.ask_for_validation()
+        raise _retry(create_mangopay_document_and_pages_and_ask_for_validation, {"id": id}, exc)
+    return _create_pages_and_ask_for_validation(document)
 
 
-@task
+@task(**task_routing("ask_for_document_validation"))
+def ask_for_document_validation(id):
+    document = loaders.documents().get(id=id, mangopay_id__isnull=False, status=DOCUMENTS_STATUS_CHOICES.created)
+    try:
+        document.ask_for_validation()
+    except APIError as exc:
+        raise _retry(ask_for_document_validation, {"id": id}, exc)
+
+
+@task(**task_routing("update_document_status"))
 def update_document_status(id):
-    document = MangoPayDocument.objects.get(id=id)
+    document = loaders.documents().get(id=id)
     if document.status == VALIDATION_ASKED:
         document.get()
 
 
 class UpdateDocumentsStatus(PeriodicTask):
     abstract = True
+    queue = task_queue("UpdateDocumentsStatus")
+    priority = task_priority("UpdateDocumentsStatus")
     run_every = crontab(minute=0, hour='8-17', day_of_week='mon-fri')
 
+    # The polls of a run are spread over the hour until the next run
+    spread = 60 * 60
+
     def run(self, *args, **kwargs):
-        documents = MangoPayDocument.objects.filter(status=VALIDATION_ASKED)
-        for document in documents:
-            update_document_status.delay(document.id)
+        at = now()
+        per_minute = getattr(settings, "MANGOPAY_DOCUMENT_POLLS_PER_MINUTE", 60)
+        ids = documents_due(at, limit=per_minute * self.spread // 60)
+        countdowns = spread_countdowns(len(ids), self.spread, per_minute)
+        for start in range(0, len(ids), 500):
+            MangoPayDocument.objects.filter(id__in=ids[start:start + 500]).update(polled_at=at)
+        for document_id, countdown in zip(ids, countdowns):
+            update_document_status.apply_async(args=(), kwargs={"id": document_id}, countdown=countdown)
 
 
-@task
-def create_mangopay_wallet(id, description):
-    wallet = MangoPayWallet.objects.get(id=id, mangopay_id__isnull=True)
+@task(**task_routing("create_mangopay_wallet"))
+def create_mangopay_wallet(id, description=None):
+    wallet = loaders.wallets().get(id=id, mangopay_id__isnull=True)
+    if description is not None:
+        wallet.description = description
     try:
-        wallet.create(description=description)
+        wallet.create()
     except APIError as exc:
         kwargs = {"id": id, "description": description}
-        raise create_mangopay_wallet.retry(args=(), kwargs=kwargs, exc=exc)
+        raise _retry(create_mangopay_wallet, kwargs, exc)
 
 
-@task
+@task(**task_routing("create_mangopay_pay_out"))
 def create_mangopay_pay_out(id, tag=''):
-    payout = MangoPayPayOut.objects.get(id=id, mangopay_id__isnull=True)
+    # Batchable payouts are created through their batch payout
+    payout = loaders.pay_outs().filter(CREATABLE).get(id=id, mangopay_id__isnull=True)
     try:
         payout.create(tag)
-    except APIError as exc:
+    except (APIError, WalletLockTimeout) as exc:
         kwargs = {"id": id, "tag": tag}
-        raise create_mangopay_pay_out.retry((), kwargs, exc=exc)
-    eta = next_weekday()
+        raise _retry(create_mangopay_pay_out, kwargs, exc)
+    eta = pay_out_follow_up(payout)
     update_mangopay_pay_out.apply_async((), {"id": id}, eta=eta)
 
 
-@task
+@task(**task_routing("update_mangopay_pay_out"))
 def update_mangopay_pay_out(id):
-    payout = MangoPayPayOut.objects.get(id=id, mangopay_id__isnull=False)
+    payout = loaders.pay_outs().get(id=id, mangopay_id__isnull=False)
     try:
         payout = payout.get()
     except APIError as exc:
-        raise update_mangopay_pay_out.retry(args=(), kwargs={"id": id}, exc=exc)
+        raise _retry(update_mangopay_pay_out, {"id": id}, exc)
+    _pay_out_updated(payout)
+
+
+def _pay_out_updated(payout):
     if not payout.status or payout.status == "CREATED":
-        eta = next_weekday()
-        update_mangopay_pay_out.apply_async(args=(), kwargs={"id": id}, eta=eta)
-    elif payout.status == "SUCCEEDED":
+        eta = pay_out_follow_up(payout)
+        update_mangopay_pay_out.apply_async(args=(), kwargs={"id": payout.id}, eta=eta)
+    else:
+        _pay_out_finished(payout)
+
+
+def _pay_out_finished(payout):
+    if payout.status == "SUCCEEDED":
         task = getattr(settings, 'MANGOPAY_PAYOUT_SUCCEEDED_TASK', None)
         if task:
-            task().run(payout_id=payout.id)
+            for payout_id in payout.batched_pay_out_ids():
+                task().run(payout_id=payout_id)
     else:
         logger.error("Payout %i could not be processed successfully" % payout.id)
 
 
-@task
+@task(**task_routing("create_mangopay_transfer"))
 def create_mangopay_transfer(transfer_id, fees=None):
-    transfer = MangoPayTransfer.objects.get(id=transfer_id)
+    transfer = loaders.transfers().get(id=transfer_id)
+    if fees is not None:
+        transfer.fees = fees
     try:
-        transfer.create(fees=fees)
-    except APIError as e:
+        transfer.create()
+    except (APIError, WalletLockTimeout) as e:
         kwargs = {"transfer_id": transfer_id, "fees": fees}
-        raise create_mangopay_transfer.retry(args=(), kwargs=kwargs, exc=e)
+        raise _retry(create_mangopay_transfer, kwargs, e)
+
+
+@task(**task_routing("create_mangopay_refund"))
+def create_mangopay_refund(id):
+    refund = loaders.refunds().get(id=id, mangopay_id__isnull=True)
+    try:
+        refund.create()
+    except (APIError, WalletLockTimeout) as exc:
+        raise _retry(create_mangopay_refund, {"id": id}, exc)
+
+
+class BatchPayOuts(PeriodicTask):
+    abstract = True
+    queue = task_queue("BatchPayOuts")
+    priority = task_priority("BatchPayOuts")
+    run_every = timedelta(seconds=getattr(settings, "MANGOPAY_PAYOUT_BATCH_WINDOW", 60 * 60))
+
+    def run(self, *args, **kwargs):
+        batches = batch_pending_pay_outs()
+        if batches:
+            job = group(create_mangopay_pay_out.s(id=batch.id) for batch in batches)
+            transaction.on_commit(job.apply_async)
+
+
+class RelayOutbox(PeriodicTask):
+    abstract = True
+    queue = task_queue("RelayOutbox")
+    priority = task_priority("RelayOutbox")
+    run_every = timedelta(seconds=getattr(settings, "MANGOPAY_OUTBOX_RELAY_INTERVAL", 5))
+    batch_size = 100
+
+    def run(self, *args, **kwargs):
+        while relay_outbox(self.app.tasks, self.batch_size) == self.batch_size:
+            pass
+
+
+def _create_pages(document):
+    """
+    Send the pages of a created document, skipping those already sent.
+    Returns the number of bytes not sent again.
+    """
+    bytes_saved = 0
+    for page in document.mangopay_pages.all():
+        if not page.create():
+            bytes_saved += page.size
+    if bytes_saved:
+        logger.info("Saved sending %d bytes of pages already sent for %r", bytes_saved, document)
+    return bytes_saved
+
+
+def _create_pages_and_ask_for_validation(document):
+    """
+    Send the pages of a created document and ask for its validation,
+    unless one of them would be refused. Returns the number of bytes not
+    sent again, and None if a page would be refused.
+    """
+    try:
+        bytes_saved = _create_pages(document)
+    except (RefusedPageError, InvalidPageError) as exc:
+        logger.warning("Not asking for the validation of %r, one of its pages would be refused: %s", document, exc)
+        return None
+    document.ask_for_validation()
+    return bytes_saved
+
+
+def _create_pay_out(payout):
+    payout.create()
+    transaction.on_commit(
+        lambda: update_mangopay_pay_out.apply_async((), {"id": payout.id}, eta=pay_out_follow_up(payout)))
+
+
+@task(**task_routing("create_mangopay_users_chunk"))
+def create_mangopay_users_chunk(ids):
+    return _create_chunk(
+        loaders.mangopay_users().filter(mangopay_id__isnull=True), ids,
+        lambda user: user.create(),
+        lambda user: create_mangopay_user.delay(id=user.id))
+
+
+@task(**task_routing("create_mangopay_bank_accounts_chunk"))
+def create_mangopay_bank_accounts_chunk(ids):
+    return _create_chunk(
+        loaders.bank_accounts().filter(mangopay_id__isnull=True), ids,
+        lambda bank_account: bank_account.create(),
+        lambda bank_account: create_mangopay_bank_account.delay(id=bank_account.id))
+
+
+@task(**task_routing("create_mangopay_documents_chunk"))
+def create_mangopay_documents_chunk(ids):
+    saved = []
+
+    def create(document):
+        document.create()
+        bytes_saved = _create_pages_and_ask_for_validation(document)
+        if bytes_saved is None:
+            return CHUNK_REFUSED
+        saved.append(bytes_saved)
+
+    outcomes = _create_chunk(
+        loaders.documents().prefetch_related("mangopay_pages").filter(mangopay_id__isnull=True, type__isnull=False),
+        ids,
+        create,
+        lambda document: create_mangopay_document_and_pages_and_ask_for_validation.delay(id=document.id))
+    outcomes[CHUNK_BYTES_SAVED] = sum(saved)
+    return outcomes
+
+
+@task(**task_routing("create_mangopay_wallets_chunk"))
+def create_mangopay_wallets_chunk(ids):
+    return _create_chunk(
+        loaders.wallets().filter(mangopay_id__isnull=True), ids,
+        lambda wallet: wallet.create(),
+        lambda wallet: create_mangopay_wallet.delay(id=wallet.id, description=wallet.description))
+
+
+@task(**task_routing("create_mangopay_pay_outs_chunk"))
+def create_mangopay_pay_outs_chunk(ids):
+    return _create_chunk(
+        loaders.pay_outs().filter(CREATABLE, mangopay_id__isnull=True), ids,
+        _create_pay_out,
+        lambda payout: create_mangopay_pay_out.delay(id=payout.id),
+        commit_each=True)
+
+
+@task(**task_routing("create_mangopay_transfers_chunk"))
+def create_mangopay_transfers_chunk(ids):
+    return _create_chunk(
+        loaders.transfers().filter(mangopay_id__isnull=True), ids,
+        lambda transfer: transfer.create(),
+        lambda transfer: create_mangopay_transfer.delay(transfer_id=transfer.id),
+        commit_each=True)
+
+
+@task(**task_routing("create_mangopay_refunds_chunk"))
+def create_mangopay_refunds_chunk(ids):
+    return _create_chunk(
+        loaders.refunds().filter(mangopay_id__isnull=True), ids,
+        lambda refund: refund.create(),
+        lambda refund: create_mangopay_refund.delay(id=refund.id),
+        commit_each=True)
+
+
+def refund_pay_ins(pay_in_ids):
+    """
+    Fully refund the given pay ins, e.g. those of a cancelled event, with at
+    most ``MANGOPAY_REFUND_CONCURRENCY`` chunk tasks running at once.
+
+    The refunds debiting the same wallet go to the same chunk since they
+    would only wait on each other's wallet lock otherwise.
+    """
+    groups = create_refunds(pay_in_ids)
+    size = getattr(settings, "MANGOPAY_REFUND_CONCURRENCY", 4)
+    job = group(create_mangopay_refunds_chunk.s(ids) for ids in partition(groups, size))
+    transaction.on_commit(job.apply_async)
+
+
+def _ask_for_validation(document):
+    document.ask_for_validation()
+
+
+def _update_pay_out(payout):
+    # The payouts still in progress are polled by the update_mangopay_pay_out
+    # they were created with, so only a status turning final is followed up
+    status = payout.status
+    payout.get()
+    if payout.status != status and payout.status in FINAL_STATUSES:
+        transaction.on_commit(lambda: _pay_out_finished(payout))
+
+
+@task(**task_routing("update_documents_status_chunk"))
+def update_documents_status_chunk(ids):
+    return _create_chunk(
+        loaders.documents().filter(mangopay_id__isnull=False, status=VALIDATION_ASKED), ids,
+        lambda document: document.get(),
+        lambda document: update_document_status.delay(document.id),
+        done=CHUNK_UPDATED)
+
+
+@task(**task_routing("ask_for_documents_validation_chunk"))
+def ask_for_documents_validation_chunk(ids):
+    return _create_chunk(
+        loaders.documents().filter(mangopay_id__isnull=False, status=DOCUMENTS_STATUS_CHOICES.created), ids,
+        _ask_for_validation,
+        lambda document: ask_for_document_validation.delay(id=document.id),
+        done=CHUNK_UPDATED)
+
+
+@task(**task_routing("update_mangopay_pay_outs_chunk"))
+def update_mangopay_pay_outs_chunk(ids):
+    return _create_chunk(
+        loaders.pay_outs().filter(NOT_COALESCED, mangopay_id__isnull=False).exclude(status__in=FINAL_STATUSES),
+        ids,
+        _update_pay_out,
+        None,
+        done=CHUNK_UPDATED)
+
+
+@task(**task_routing("fill_card_registration_pool"))
+def fill_card_registration_pool(mangopay_user_id, currency):
+    stale = MangoPayCardRegistration.objects.stale(mangopay_user_id, currency)
+    MangoPayCard.objects.filter(mangopay_card_registration__in=stale).delete()
+
+    size = getattr(settings, "MANGOPAY_CARD_REGISTRATION_POOL_SIZE", 1)
+    missing = size - MangoPayCardRegistration.objects.pooled(mangopay_user_id, currency).count()
+    if missing <= 0:
+        return
+    mangopay_user = loaders.mangopay_users().get(id=mangopay_user_id, mangopay_id__isnull=False)
+    for i in range(missing):
+        card_registration = MangoPayCardRegistration(
+            mangopay_user=mangopay_user, currency=currency, pooled_at=now())
+        try:
+            card_registration.create()
+        except APIError as exc:
+            kwargs = {"mangopay_user_id": mangopay_user_id, "currency": currency}
+            raise _retry(fill_card_registration_pool, kwargs, exc)
+
+
+def claim_card_registration(mangopay_user, currency="EUR"):
+    """
+    Return a created card registration for the user, from the pool if it
+    has one, and refill the pool in the background.
+    """
+    card_registration = MangoPayCardRegistration.objects.claim(mangopay_user, currency)
+    transaction.on_commit(lambda: fill_card_registration_pool.delay(mangopay_user.id, currency))
+    if card_registration is None:
+        card_registration = MangoPayCardRegistration(mangopay_user=mangopay_user, currency=currency)
+        card_registration.create()
+    return card_registration
+
+
+@task(**task_routing("refresh_mangopay_cards"))
+def refresh_mangopay_cards(mangopay_user_ids):
+    users = MangoPayUser.objects.filter(id__in=mangopay_user_ids, mangopay_id__isnull=False)
+    failed = []
+    error = None
+    for mangopay_user_id, mangopay_id in users.values_list("id", "mangopay_id"):
+        try:
+            refresh_cards(mangopay_user_id, mangopay_id)
+        except APIError as exc:
+            failed.append(mangopay_user_id)
+            error = exc
+    if failed:
+        raise _retry(refresh_mangopay_cards, {"mangopay_user_ids": failed}, error)
+
+
+class RefreshCards(PeriodicTask):
+    abstract = True
+    queue = task_queue("RefreshCards")
+    priority = task_priority("RefreshCards")
+    run_every = crontab(minute=0, hour=3, day_of_month=1)
+
+    def run(self, *args, **kwargs):
+        ids = mangopay_user_ids_with_cards_to_refresh()
+        for start in range(0, len(ids), 100):
+            refresh_mangopay_cards.delay(ids[start:start + 100])
+
+
+class ScanExpiringCards(PeriodicTask):
+    abstract = True
+    queue = task_queue("ScanExpiringCards")
+    priority = task_priority("ScanExpiringCards")
+    run_every = crontab(minute=0, hour=4, day_of_month=1)
+
+    def run(self, *args, **kwargs):
+        task = getattr(settings, 'MANGOPAY_CARD_EXPIRING_TASK', None)
+        if not task:
+            return
+        months = getattr(settings, 'MANGOPAY_CARD_EXPIRY_NOTICE_MONTHS', 1)
+        for card_id in expiring_card_ids(months).iterator():
+            task().run(card_id=card_id)
+
+
+class CreateStatusEventPartitions(PeriodicTask):
+    abstract = True
+    queue = task_queue("CreateStatusEventPartitions")
+    priority = task_priority("CreateStatusEventPartitions")
+    run_every = crontab(minute=0, hour=2, day_of_month=1)
+
+    def run(self, *args, **kwargs):
+        create_partitions(months=3)
@@ -5,12 +5,35 @@ from .users import (
     RegularAuthenticationMangoPayLegalUserTests
 )
 from .bank_account import MangoPayBankAccountTests
-from .card_registration import MangoPayCardRegistrationTests
+from .card_registration import MangoPayCardRegistrationTests, MangoPayCardRegistrationPoolTests
 from .card import MangoPayCardTests
-from .document import MangoPayDocumentTests
+from .document import MangoPayDocumentTests, MangoPayDocumentSaveChangesTests
 from .wallet import MangoPayWalletTests
 from .payout import MangoPayPayOutTests
 from .payin import MangoPayPayByCardInTests, MangoPayPayInBankWireTests
-from .refund import MangoPayRefundTests
-from .page import MangoPayPageTests
+from .refund import MangoPayRefundTests, RefundPayInsTests
+from .page import (
+    MangoPayPageTests, MangoPayPageStorageTests, MangoPayPagePreflightTests,
+    MangoPayPageDeduplicationTests, MangoPayPageOptimizationTests
+)
 from .transfer import MangoPayTransferTests, CreateMangoPayTransferTasksTests
+from .loaders import LoaderQueryCountTests
+from .payloads import FetchTransactionTests
+from .outbox import OutboxTests
+from .events import StatusEventTests
+from .calendars import BusinessCalendarTests
+from .documents import DocumentsDueTests, SpreadCountdownsTests
+from .batching import BatchPendingPayOutsTests
+from .chunks import (
+    ChunkQuerysetTests, CreateMangoPayWalletsChunkTests, UpdateDocumentsStatusChunkTests,
+    UpdateMangoPayPayOutsChunkTests, CreateMangoPayTransfersChunkTests, AskForDocumentsValidationChunkTests,
+    CreateMangoPayDocumentsChunkTests, RetryOnTheirOwnTests
+)
+from .routing import TaskRoutingTests
+from .admin import MangoPayAdminTests
+from .locks import WalletLockTests
+from .circuit_breaker import CircuitBreakerTests, CircuitOpenRetryTests
+from .coalescing import SingleFlightTests
+from .cards import RefreshCardsTests, ExpiringCardsTests
+from .importers import UpsertUsersTests, ImportUsersTests
+from .remote_ids import RemoteIdModelsTests
@@ -0,0 +1,65 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from unittest.mock import Mock, patch
+
+from ..admin import MangoPayWalletAdmin
+from ..tasks import CHUNK_CREATED, CHUNK_SKIPPED
+
+from .factories import MangoPayWalletFactory
+
+
+class MangoPayAdminTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(user)
+        self.job = Mock()
+        self.job.apply_async.return_value.id = "group-1"
+
+    def group(self, signatures):
+        self.chunks = [signature.args[0] for signature in signatures]
+        return self.job
+
+    @patch.object(MangoPayWalletAdmin, "chunk_size", 2)
+    def test_actions_enqueue_chunks(self):
+        wallets = [MangoPayWalletFactory() for i in range(3)]
+        MangoPayWalletFactory(mangopay_id="1")
+        with patch("mangopay2.admin.group", side_effect=self.group):
+            response = self.client.post(reverse("admin:mangopay2_mangopaywallet_changelist"), {
+                "action": "create_remotely",
+                "_selected_action": [wallet.id for wallet in wallets],
+            }, follow=True)
+        self.assertEqual(self.chunks, [[wallets[0].id, wallets[1].id], [wallets[2].id]])
+        self.job.apply_async.return_value.save.assert_called_once_with()
+        self.assertContains(response, "Queued 3 objects in 2 chunks.")
+        self.assertContains(response, reverse("admin:mangopay2_mangopaywallet_progress", args=("group-1",)))
+
+    def test_actions_with_nothing_to_do(self):
+        wallet = MangoPayWalletFactory(mangopay_id="1")
+        with patch("mangopay2.admin.group") as group_mock:
+            response = self.client.post(reverse("admin:mangopay2_mangopaywallet_changelist"), {
+                "action": "create_remotely",
+                "_selected_action": [wallet.id],
+            }, follow=True)
+        group_mock.assert_not_called()
+        self.assertContains(response, "Nothing to do for the selected objects.")
+
+    def test_progress_counts_the_outcomes(self):
+        chunks = [
+            Mock(result={1: CHUNK_CREATED, 2: CHUNK_SKIPPED}, **{"successful.return_value": True,
+                                                                  "failed.return_value": False}),
+            Mock(result=None, **{"successful.return_value": False, "failed.return_value": True}),
+        ]
+        result = Mock(results=chunks, **{"completed_count.return_value": 2})
+        with patch("mangopay2.admin.GroupResult.restore", return_value=result):
+            response = self.client.get(reverse("admin:mangopay2_mangopaywallet_progress", args=("group-1",)))
+        self.assertTemplateUsed(response, "admin/mangopay2/progress.html")
+        self.assertContains(response, "2 of 2 chunks done, 1 failed.")
+        self.assertContains(response, "<td>created</td><td>1</td>")
+
+    def test_progress_of_an_unknown_group(self):
+        with patch("mangopay2.admin.GroupResult.restore", return_value=None):
+            response = self.client.get(reverse("admin:mangopay2_mangopaywallet_progress", args=("group-1",)))
+        self.assertEqual(response.status_code, 404)
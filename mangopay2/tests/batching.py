@@ -0,0 +1,107 @@
+from django.test import TestCase
+
+from unittest.mock import Mock, patch
+from money import Money
+
+from ..batching import batch_pending_pay_outs
+from ..models import MangoPayPayOut, MangoPayPayOutBatchItem
+from ..tasks import BatchPayOuts, create_mangopay_pay_out
+
+from .factories import MangoPayPayOutFactory, MangoPayWalletFactory, MangoPayBankAccountFactory
+
+
+class BatchPendingPayOutsTests(TestCase):
+
+    def setUp(self):
+        self.wallet = MangoPayWalletFactory()
+        self.bank_account = MangoPayBankAccountFactory(mangopay_user=self.wallet.mangopay_user)
+
+    def pay_out(self, amount, **kwargs):
+        defaults = {"mangopay_user": self.wallet.mangopay_user,
+                    "mangopay_wallet": self.wallet,
+                    "mangopay_bank_account": self.bank_account,
+                    "debited_funds": Money(amount, "EUR"),
+                    "fees": Money(1, "EUR"),
+                    "batchable": True}
+        defaults.update(kwargs)
+        return MangoPayPayOutFactory(**defaults)
+
+    def test_pay_outs_to_the_same_bank_account_are_coalesced(self):
+        first = self.pay_out(100)
+        second = self.pay_out(50)
+        batches = batch_pending_pay_outs()
+        self.assertEqual(len(batches), 1)
+        batch = MangoPayPayOut.objects.get(id=batches[0].id)
+        self.assertEqual(batch.debited_funds, Money(150, "EUR"))
+        self.assertEqual(batch.fees, Money(2, "EUR"))
+        self.assertEqual(sorted(batch.batched_pay_out_ids()), [first.id, second.id])
+
+    def test_single_pay_out_is_its_own_batch(self):
+        pay_out = self.pay_out(100)
+        other_bank_account = MangoPayBankAccountFactory(mangopay_user=self.wallet.mangopay_user)
+        other = self.pay_out(100, mangopay_bank_account=other_bank_account)
+        batches = batch_pending_pay_outs()
+        self.assertEqual(sorted(b.id for b in batches), [pay_out.id, other.id])
+        self.assertEqual(MangoPayPayOut.objects.count(), 2)
+
+    def test_batched_pay_outs_are_not_picked_up_again(self):
+        self.pay_out(100)
+        self.pay_out(50)
+        batch_pending_pay_outs()
+        self.assertEqual(batch_pending_pay_outs(), [])
+        self.assertEqual(MangoPayPayOutBatchItem.objects.count(), 2)
+
+    def test_batch_status_is_copied_to_batched_pay_outs(self):
+        first = self.pay_out(100)
+        self.pay_out(50)
+        batch = batch_pending_pay_outs()[0]
+        batch.mangopay_id = 42
+        batch.status = "SUCCEEDED"
+        batch.save()
+        batch._update_batched_pay_outs()
+        first = MangoPayPayOut.objects.get(id=first.id)
+        self.assertEqual(first.mangopay_id, "42")
+        self.assertEqual(first.status, "SUCCEEDED")
+
+    def test_pay_outs_not_batchable_are_not_coalesced(self):
+        self.pay_out(100, batchable=False)
+        self.assertEqual(batch_pending_pay_outs(), [])
+
+    @patch("mangopay2.models.MangoPayPayOut.create")
+    def test_batchable_pay_outs_are_only_created_through_their_batch(self, create_mock):
+        first = self.pay_out(100)
+        self.pay_out(50)
+        with self.assertRaises(MangoPayPayOut.DoesNotExist):
+            create_mangopay_pay_out.run(id=first.id)
+        batch_pending_pay_outs()
+        with self.assertRaises(MangoPayPayOut.DoesNotExist):
+            create_mangopay_pay_out.run(id=first.id)
+        create_mock.assert_not_called()
+
+    @patch("mangopay2.tasks.update_mangopay_pay_out.apply_async")
+    @patch("mangopay2.tasks.transaction.on_commit", lambda callback: callback())
+    def test_batches_are_created_by_the_periodic_task(self, apply_async_mock):
+        first = self.pay_out(100)
+        second = self.pay_out(50)
+
+        def run_group(signatures):
+            signatures = list(signatures)
+            return Mock(apply_async=lambda: [signature.apply(throw=True) for signature in signatures])
+
+        def save(pay_out):
+            # The API sends the creation date back, the SDK does not declare it
+            pay_out.id = "9"
+            pay_out.status = "CREATED"
+            pay_out.creation_date = None
+
+        with patch("mangopay2.tasks.group", side_effect=run_group), \
+                patch("mangopay2.models.BankWirePayOut.save", autospec=True, side_effect=save) as save_mock:
+            BatchPayOuts().run()
+
+        save_mock.assert_called_once()
+        self.assertEqual(save_mock.call_args[0][0].debited_funds.amount, 15000)
+        batch = MangoPayPayOut.objects.exclude(id__in=[first.id, second.id]).get()
+        self.assertEqual(set(MangoPayPayOut.objects.filter(mangopay_id="9").values_list("id", flat=True)),
+                         {batch.id, first.id, second.id})
+        apply_async_mock.assert_called_once()
+        self.assertEqual(apply_async_mock.call_args[0][1], {"id": batch.id})
@@ -0,0 +1,44 @@
+from datetime import date, datetime, time
+
+import pytz
+from django.test import SimpleTestCase, override_settings
+
+from ..calendars import BusinessCalendar, TARGET2Calendar, calendar_for, easter_sunday
+
+UTC = pytz.utc
+
+
+class BusinessCalendarTests(SimpleTestCase):
+
+    def setUp(self):
+        self.calendar = TARGET2Calendar()
+
+    def test_easter(self):
+        self.assertEqual(easter_sunday(2026), date(2026, 4, 5))
+        self.assertEqual(easter_sunday(2027), date(2027, 3, 28))
+
+    def test_next_business_day(self):
+        self.assertEqual(self.calendar.next_business_day(date(2026, 4, 3)), date(2026, 4, 7))
+        self.assertEqual(self.calendar.next_business_day(date(2026, 12, 25)), date(2026, 12, 28))
+        self.assertEqual(self.calendar.next_business_day(date(2027, 1, 1)), date(2027, 1, 4))
+        self.assertEqual(self.calendar.next_business_day(date(2026, 10, 19)), date(2026, 10, 19))
+
+    def test_year_end_rolls_over(self):
+        self.assertEqual(BusinessCalendar().next_business_day(date(2027, 12, 31)), date(2027, 12, 31))
+        self.assertEqual(self.calendar.next_business_day(date(2028, 12, 30)), date(2029, 1, 2))
+
+    def test_slots_are_in_business_hours(self):
+        after = UTC.localize(datetime(2026, 4, 2, 16, 30))
+        for key in range(50):
+            slot = self.calendar.next_slot(after, key)
+            self.assertEqual(slot.date(), date(2026, 4, 7))
+            self.assertTrue(time(9) <= slot.time() < time(17))
+
+    def test_slot_later_today(self):
+        after = UTC.localize(datetime(2026, 10, 19, 5))
+        self.assertEqual(self.calendar.next_slot(after, 1).date(), date(2026, 10, 19))
+
+    @override_settings(MANGOPAY_BUSINESS_CALENDARS={"GBP": "mangopay2.calendars.TARGET2Calendar"})
+    def test_calendar_for(self):
+        self.assertIsInstance(calendar_for("GBP"), TARGET2Calendar)
+        self.assertIs(type(calendar_for("USD")), BusinessCalendar)
@@ -1,4 +1,7 @@
-from django.test import TestCase
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils.timezone import now
 
 from unittest.mock import patch
 
@@ -40,3 +43,36 @@ class MangoPayCardRegistrationTests(TestCase):
         self.card_registration.save_mangopay_card_id(card_id)
         self.assertEqual(self.card_registration.mangopay_card.mangopay_id,
                          card_id)
+
+
+class MangoPayCardRegistrationPoolTests(TestCase):
+
+    def setUp(self):
+        self.card_registration = MangoPayCardRegistrationFactory(mangopay_id=42, currency="EUR", pooled_at=now())
+        self.mangopay_user = self.card_registration.mangopay_user
+
+    def test_claim(self):
+        claimed = MangoPayCardRegistration.objects.claim(self.mangopay_user, "EUR")
+        self.assertEqual(claimed, self.card_registration)
+        self.assertIsNone(claimed.pooled_at)
+        self.assertIsNone(MangoPayCardRegistration.objects.claim(self.mangopay_user, "EUR"))
+
+    def test_claim_other_currency(self):
+        self.assertIsNone(MangoPayCardRegistration.objects.claim(self.mangopay_user, "SEK"))
+
+    @override_settings(MANGOPAY_CARD_REGISTRATION_POOL_MAX_AGE=60)
+    def test_stale_registrations_are_not_claimed(self):
+        MangoPayCardRegistration.objects.filter(id=self.card_registration.id).update(
+            pooled_at=now() - timedelta(seconds=61))
+        self.assertIsNone(MangoPayCardRegistration.objects.claim(self.mangopay_user, "EUR"))
+        self.assertTrue(MangoPayCardRegistration.objects.stale(self.mangopay_user, "EUR").exists())
+
+    def test_preregistration_data_is_stored(self):
+        self.card_registration.preregistration_data = "PreregistrationData"
+        self.card_registration.access_key = "AccessKey"
+        self.card_registration.card_registration_url = "https://card.registration"
+        self.assertEqual(self.card_registration.get_preregistration_data(), {
+            "preregistrationData": "PreregistrationData",
+            "accessKey": "AccessKey",
+            "cardRegistrationURL": "https://card.registration",
+        })
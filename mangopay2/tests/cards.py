@@ -0,0 +1,85 @@
+from datetime import date
+
+from django.test import TestCase
+
+from unittest.mock import patch
+from mangopay.resources import Card
+
+from ..cards import (
+    mangopay_user_ids_with_cards_to_refresh, refresh_cards, date_of_month, backfill_expiration_months
+)
+from ..models import MangoPayCard, expiration_date_as_date
+
+from .factories import MangoPayCardFactory, MangoPayCardRegistrationFactory, MangoPayNaturalUserFactory
+
+
+def remote_card(id, expiration_date="1230", validity="VALID"):
+    return Card(id=id, expiration_date=expiration_date, alias="497010XXXXXX4414", active=True, validity=validity)
+
+
+class RefreshCardsTests(TestCase):
+
+    def setUp(self):
+        self.mangopay_user = MangoPayNaturalUserFactory(mangopay_id=7)
+        self.card = MangoPayCardFactory(mangopay_id=1, expiration_date="0120")
+        MangoPayCardRegistrationFactory(mangopay_user=self.mangopay_user, mangopay_card=self.card)
+
+    def test_expiration_date_as_date(self):
+        self.assertEqual(expiration_date_as_date("0120"), date(2020, 1, 1))
+        self.assertIsNone(expiration_date_as_date(None))
+        self.assertIsNone(expiration_date_as_date("XXXX"))
+
+    def test_users_with_far_future_cards_are_skipped(self):
+        self.assertEqual(mangopay_user_ids_with_cards_to_refresh(), [self.mangopay_user.id])
+        MangoPayCard.objects.filter(id=self.card.id).update(expiration_date="1299", expiration_month=date(2099, 12, 1))
+        self.assertEqual(mangopay_user_ids_with_cards_to_refresh(), [])
+
+    def test_users_are_listed_once(self):
+        card = MangoPayCardFactory(mangopay_id=2, expiration_date=None)
+        MangoPayCardRegistrationFactory(mangopay_user=self.mangopay_user, mangopay_card=card)
+        with self.assertNumQueries(1):
+            self.assertEqual(mangopay_user_ids_with_cards_to_refresh(), [self.mangopay_user.id])
+
+    @patch("mangopay2.cards.remote_cards")
+    def test_changed_cards_are_updated(self, remote_cards_mock):
+        remote_cards_mock.return_value = [remote_card("1"), remote_card("999")]
+        self.assertEqual(refresh_cards(self.mangopay_user.id, self.mangopay_user.mangopay_id), 1)
+        card = MangoPayCard.objects.get(id=self.card.id)
+        self.assertEqual(card.expiration_date, "1230")
+        self.assertTrue(card.is_active)
+        self.assertTrue(card.is_valid)
+
+    @patch("mangopay2.cards.remote_cards")
+    def test_unchanged_cards_are_not_written(self, remote_cards_mock):
+        remote_cards_mock.return_value = [remote_card("1", expiration_date="0120", validity="UNKNOWN")]
+        refresh_cards(self.mangopay_user.id, self.mangopay_user.mangopay_id)
+        remote_cards_mock.return_value = [remote_card("1", expiration_date="0120", validity="UNKNOWN")]
+        with self.assertNumQueries(1):
+            self.assertEqual(refresh_cards(self.mangopay_user.id, self.mangopay_user.mangopay_id), 0)
+
+
+class ExpiringCardsTests(TestCase):
+
+    def test_expiration_month_is_kept_in_sync(self):
+        card = MangoPayCardFactory(expiration_date="0330")
+        self.assertEqual(card.expiration_month, date(2030, 3, 1))
+        card.expiration_date = None
+        card.save()
+        self.assertIsNone(MangoPayCard.objects.get(id=card.id).expiration_month)
+
+    def test_expiring(self):
+        card = MangoPayCardFactory(expiration_date="0330", is_active=True)
+        MangoPayCardFactory(expiration_date="0330", is_active=False)
+        MangoPayCardFactory(expiration_date="0430", is_active=True)
+        expiring = MangoPayCard.objects.expiring(date(2030, 3, 1), date(2030, 4, 1))
+        self.assertEqual(list(expiring), [card])
+
+    def test_date_of_month(self):
+        self.assertEqual(date_of_month(2020, 13), date(2021, 1, 1))
+        self.assertEqual(date_of_month(2020, 12), date(2020, 12, 1))
+
+    def test_backfill(self):
+        card = MangoPayCardFactory(expiration_date="0330")
+        MangoPayCard.objects.filter(id=card.id).update(expiration_month=None)
+        backfill_expiration_months(chunk_size=1)
+        self.assertEqual(MangoPayCard.objects.get(id=card.id).expiration_month, date(2030, 3, 1))
@@ -0,0 +1,190 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from unittest.mock import Mock, patch
+from mangopay.exceptions import APIError
+
+from ..models import (
+    MangoPayWallet, MangoPayPage, MangoPayPayOut, MangoPayPayOutBatchItem, MangoPayTransfer, CREATED, VALIDATION_ASKED,
+    RefusedPageError
+)
+from ..tasks import (
+    chunk_queryset, create_mangopay_wallet, create_mangopay_pay_out, create_mangopay_transfer,
+    create_mangopay_wallets_chunk, create_mangopay_documents_chunk, create_mangopay_pay_outs_chunk,
+    create_mangopay_transfers_chunk, update_documents_status_chunk, ask_for_documents_validation_chunk,
+    update_mangopay_pay_outs_chunk, CHUNK_CREATED, CHUNK_UPDATED, CHUNK_SKIPPED, CHUNK_RETRYING, CHUNK_FAILED,
+    CHUNK_REFUSED, CHUNK_BYTES_SAVED
+)
+
+from .factories import (
+    MangoPayWalletFactory, MangoPayDocumentFactory, MangoPayPageFactory, MangoPayPayOutFactory, MangoPayTransferFactory
+)
+
+
+class ChunkQuerysetTests(TestCase):
+
+    def test_chunks_cover_the_queryset_in_order(self):
+        ids = [MangoPayWalletFactory().id for i in range(5)]
+        chunks = list(chunk_queryset(MangoPayWallet.objects.all(), size=2))
+        self.assertEqual(chunks, [ids[0:2], ids[2:4], ids[4:5]])
+
+    def test_empty_queryset(self):
+        self.assertEqual(list(chunk_queryset(MangoPayWallet.objects.none())), [])
+
+
+class CreateMangoPayWalletsChunkTests(TestCase):
+
+    def setUp(self):
+        self.wallet = MangoPayWalletFactory()
+        self.created_wallet = MangoPayWalletFactory(mangopay_id=12)
+
+    @patch("mangopay2.models.MangoPayWallet.create")
+    def test_outcome_per_id(self, create_mock):
+        outcomes = create_mangopay_wallets_chunk.run([self.wallet.id, self.created_wallet.id])
+        self.assertEqual(outcomes, {self.wallet.id: CHUNK_CREATED, self.created_wallet.id: CHUNK_SKIPPED})
+        create_mock.assert_called_once()
+
+    @patch("mangopay2.models.MangoPayWallet.create")
+    def test_api_errors_are_retried_on_their_own(self, create_mock):
+        create_mock.side_effect = APIError("Service unavailable")
+        outcomes = create_mangopay_wallets_chunk.run([self.wallet.id])
+        self.assertEqual(outcomes, {self.wallet.id: CHUNK_RETRYING})
+
+
+class UpdateDocumentsStatusChunkTests(TestCase):
+
+    def setUp(self):
+        self.document = MangoPayDocumentFactory(mangopay_id="1", status=VALIDATION_ASKED)
+        self.created_document = MangoPayDocumentFactory(mangopay_id="2", status=CREATED)
+
+    @patch("mangopay2.models.MangoPayDocument.get")
+    def test_only_documents_waiting_for_validation_are_updated(self, get_mock):
+        outcomes = update_documents_status_chunk.run([self.document.id, self.created_document.id])
+        self.assertEqual(outcomes, {self.document.id: CHUNK_UPDATED, self.created_document.id: CHUNK_SKIPPED})
+        get_mock.assert_called_once()
+
+    @patch("mangopay2.models.MangoPayDocument.get", autospec=True, side_effect=lambda document: document)
+    def test_returned_instances_are_not_outcomes(self, get_mock):
+        outcomes = update_documents_status_chunk.run([self.document.id])
+        self.assertEqual(outcomes, {self.document.id: CHUNK_UPDATED})
+
+
+@patch("mangopay2.tasks.transaction.on_commit", lambda callback: callback())
+@patch("mangopay2.tasks.update_mangopay_pay_out.apply_async")
+class UpdateMangoPayPayOutsChunkTests(TestCase):
+
+    def setUp(self):
+        self.payout = MangoPayPayOutFactory(mangopay_id="1", status="CREATED")
+        self.succeeded_task = Mock()
+
+    def refresh(self, status, ids):
+        with patch("mangopay2.models.fetch_transaction", return_value=Mock(status=status, creation_date=None)):
+            with override_settings(MANGOPAY_PAYOUT_SUCCEEDED_TASK=self.succeeded_task):
+                return update_mangopay_pay_outs_chunk.run(ids)
+
+    def test_succeeded_payouts_are_followed_up_once(self, apply_async_mock):
+        self.assertEqual(self.refresh("SUCCEEDED", [self.payout.id]), {self.payout.id: CHUNK_UPDATED})
+        self.assertEqual(self.refresh("SUCCEEDED", [self.payout.id]), {self.payout.id: CHUNK_SKIPPED})
+        self.succeeded_task.return_value.run.assert_called_once_with(payout_id=self.payout.id)
+        apply_async_mock.assert_not_called()
+
+    def test_payouts_in_progress_are_not_polled_again(self, apply_async_mock):
+        self.assertEqual(self.refresh("CREATED", [self.payout.id]), {self.payout.id: CHUNK_UPDATED})
+        self.succeeded_task.assert_not_called()
+        apply_async_mock.assert_not_called()
+
+    def test_coalesced_payouts_are_skipped(self, apply_async_mock):
+        coalesced = MangoPayPayOutFactory(mangopay_id="1", status="CREATED")
+        MangoPayPayOutBatchItem.objects.create(batch=self.payout, pay_out=self.payout)
+        MangoPayPayOutBatchItem.objects.create(batch=self.payout, pay_out=coalesced)
+        self.assertEqual(self.refresh("SUCCEEDED", [self.payout.id, coalesced.id]),
+                         {self.payout.id: CHUNK_UPDATED, coalesced.id: CHUNK_SKIPPED})
+        self.assertEqual(self.succeeded_task.return_value.run.call_count, 2)
+
+    def test_api_errors_fail_without_retrying(self, apply_async_mock):
+        with patch("mangopay2.models.fetch_transaction", side_effect=APIError("Service unavailable")):
+            outcomes = update_mangopay_pay_outs_chunk.run([self.payout.id])
+        self.assertEqual(outcomes, {self.payout.id: CHUNK_FAILED})
+        apply_async_mock.assert_not_called()
+
+
+class CreateMangoPayTransfersChunkTests(TransactionTestCase):
+
+    def test_created_transfers_are_kept_when_the_chunk_is_interrupted(self):
+        transfers = [MangoPayTransferFactory(), MangoPayTransferFactory()]
+
+        def create(transfer, fees=None):
+            if transfer.id == transfers[1].id:
+                raise SystemExit()
+            transfer.mangopay_id = "1"
+            transfer.save()
+
+        with patch("mangopay2.models.MangoPayTransfer.create", autospec=True, side_effect=create):
+            with self.assertRaises(SystemExit):
+                create_mangopay_transfers_chunk.run([transfer.id for transfer in transfers])
+        self.assertEqual(MangoPayTransfer.objects.get(id=transfers[0].id).mangopay_id, "1")
+
+
+class AskForDocumentsValidationChunkTests(TestCase):
+
+    def setUp(self):
+        self.document = MangoPayDocumentFactory(mangopay_id="1", status=CREATED)
+
+    @patch("mangopay2.tasks.transaction.on_commit", lambda callback: callback())
+    @patch("mangopay2.tasks.ask_for_document_validation.delay")
+    @patch("mangopay2.models.MangoPayDocument.ask_for_validation", side_effect=APIError("Service unavailable"))
+    def test_api_errors_are_retried_on_their_own(self, ask_for_validation_mock, delay_mock):
+        outcomes = ask_for_documents_validation_chunk.run([self.document.id])
+        self.assertEqual(outcomes, {self.document.id: CHUNK_RETRYING})
+        delay_mock.assert_called_once_with(id=self.document.id)
+
+
+@patch("mangopay2.models.MangoPayDocument.ask_for_validation")
+@patch("mangopay2.models.MangoPayDocument.create")
+class CreateMangoPayDocumentsChunkTests(TestCase):
+
+    def setUp(self):
+        self.document = MangoPayDocumentFactory()
+        self.page = MangoPayPageFactory(document=self.document)
+
+    @patch("mangopay2.models.MangoPayPage.create", return_value=False)
+    def test_bytes_saved_are_reported(self, page_create_mock, create_mock, ask_for_validation_mock):
+        MangoPayPage.objects.filter(id=self.page.id).update(size=40000)
+        outcomes = create_mangopay_documents_chunk.run([self.document.id])
+        self.assertEqual(outcomes, {self.document.id: CHUNK_CREATED, CHUNK_BYTES_SAVED: 40000})
+        ask_for_validation_mock.assert_called_once_with()
+
+    @patch("mangopay2.models.MangoPayPage.create", side_effect=RefusedPageError("Same bytes as a refused page"))
+    def test_refused_pages_are_reported(self, page_create_mock, create_mock, ask_for_validation_mock):
+        outcomes = create_mangopay_documents_chunk.run([self.document.id])
+        self.assertEqual(outcomes, {self.document.id: CHUNK_REFUSED, CHUNK_BYTES_SAVED: 0})
+        ask_for_validation_mock.assert_not_called()
+
+
+@patch("mangopay2.tasks.transaction.on_commit", lambda callback: callback())
+class RetryOnTheirOwnTests(TestCase):
+    """
+    The rows a chunk failed to create are handed to their single object
+    task, which must be able to create them.
+    """
+
+    def retry(self, model, task, chunk, instance):
+        with patch.object(model, "create", autospec=True,
+                          side_effect=[APIError("Service unavailable"), None]) as create_mock, \
+                patch.object(task, "delay", side_effect=lambda **kwargs: task.run(**kwargs)):
+            outcomes = chunk.run([instance.id])
+        self.assertEqual(outcomes, {instance.id: CHUNK_RETRYING})
+        self.assertEqual(create_mock.call_count, 2)
+
+    def test_wallets(self):
+        wallet = MangoPayWalletFactory(description="Main wallet")
+        self.retry(MangoPayWallet, create_mangopay_wallet, create_mangopay_wallets_chunk, wallet)
+
+    @patch("mangopay2.tasks.update_mangopay_pay_out.apply_async")
+    def test_pay_outs(self, apply_async_mock):
+        payout = MangoPayPayOutFactory()
+        self.retry(MangoPayPayOut, create_mangopay_pay_out, create_mangopay_pay_outs_chunk, payout)
+        apply_async_mock.assert_called_once()
+
+    def test_transfers(self):
+        transfer = MangoPayTransferFactory()
+        self.retry(MangoPayTransfer, create_mangopay_transfer, create_mangopay_transfers_chunk, transfer)
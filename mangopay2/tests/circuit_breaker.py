@@ -0,0 +1,83 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from unittest.mock import patch
+from celery.exceptions import Retry
+from mangopay.exceptions import APIError
+
+from ..client import MangoPayAPIRequest, CircuitOpenError, endpoint_family
+from ..tasks import create_mangopay_user
+
+from .factories import MangoPayNaturalUserFactory
+
+
+@override_settings(MANGOPAY_CIRCUIT_BREAKER_THRESHOLD=2, MANGOPAY_CIRCUIT_BREAKER_COOLDOWN=30)
+@patch("mangopay.api.APIRequest.request")
+class CircuitBreakerTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.handler = MangoPayAPIRequest()
+
+    def fail(self, request_mock, url="/payins/card/direct", code=None):
+        request_mock.side_effect = APIError("Service unavailable", code=code)
+        with self.assertRaises(APIError):
+            self.handler.request("POST", url)
+
+    def test_circuit_opens_after_failures(self, request_mock):
+        self.fail(request_mock)
+        self.fail(request_mock)
+        request_mock.reset_mock()
+        with self.assertRaises(CircuitOpenError) as raised:
+            self.handler.request("POST", "/payins/card/direct")
+        request_mock.assert_not_called()
+        self.assertEqual(raised.exception.retry_after, 30)
+
+    def test_families_have_their_own_circuit(self, request_mock):
+        self.fail(request_mock)
+        self.fail(request_mock)
+        request_mock.side_effect = None
+        self.handler.request("GET", "/users/1")
+        request_mock.assert_called_with("GET", "/users/1", None, None, False)
+
+    def test_client_errors_do_not_count(self, request_mock):
+        self.fail(request_mock, code=400)
+        self.fail(request_mock, code=404)
+        request_mock.side_effect = None
+        self.handler.request("POST", "/payins/card/direct")
+
+    def test_success_resets_the_failures(self, request_mock):
+        self.fail(request_mock, code=503)
+        request_mock.side_effect = None
+        self.handler.request("POST", "/payins/card/direct")
+        self.fail(request_mock, code=503)
+        request_mock.side_effect = None
+        self.handler.request("POST", "/payins/card/direct")
+
+    def test_endpoint_family(self, request_mock):
+        self.assertEqual(endpoint_family("/payins/card/direct"), "payins")
+        self.assertEqual(endpoint_family("/KYC/documents/1"), "kyc")
+        self.assertEqual(endpoint_family("/users?page=1"), "users")
+
+
+@patch("mangopay2.tasks.create_mangopay_user.apply_async")
+@patch("mangopay2.models.MangoPayUser.create", side_effect=CircuitOpenError("/users", 30))
+class CircuitOpenRetryTests(TestCase):
+
+    def setUp(self):
+        self.user = MangoPayNaturalUserFactory()
+
+    def tearDown(self):
+        create_mangopay_user.pop_request()
+
+    def test_tasks_are_sent_again_once_the_circuit_may_be_closed(self, create_mock, apply_async_mock):
+        create_mangopay_user.push_request(retries=0)
+        with self.assertRaises(Retry):
+            create_mangopay_user.run(id=self.user.id)
+        apply_async_mock.assert_called_once_with(args=(), kwargs={"id": self.user.id}, countdown=30, retries=0)
+
+    def test_retries_are_not_spent(self, create_mock, apply_async_mock):
+        create_mangopay_user.push_request(retries=create_mangopay_user.max_retries)
+        with self.assertRaises(Retry):
+            create_mangopay_user.run(id=self.user.id)
+        self.assertEqual(apply_async_mock.call_args[1]["retries"], create_mangopay_user.max_retries)
@@ -0,0 +1,63 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from ..client import SingleFlight
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+        self.addCleanup(self.release.set)
+
+    def wait_for_coalesced(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.flights.lock:
+                if self.flights.stats["coalesced"] >= count:
+                    return
+            time.sleep(0.01)
+        self.fail("%d calls were not coalesced within %ss" % (count, timeout))
+
+    def call(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return {"Id": "1"}
+
+    def test_concurrent_calls_share_one_call(self):
+        results = []
+        leader = threading.Thread(target=lambda: results.append(self.flights.do("key", self.call)))
+        leader.start()
+        self.started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(self.flights.do("key", self.call)))
+                     for i in range(3)]
+        for follower in followers:
+            follower.start()
+        self.wait_for_coalesced(3)
+        self.release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{"Id": "1"}] * 4)
+        self.assertEqual(dict(self.flights.stats), {"calls": 1, "coalesced": 3})
+
+    def test_later_calls_are_not_coalesced(self):
+        self.release.set()
+        self.flights.do("key", self.call)
+        self.flights.do("key", self.call)
+        self.assertEqual(self.calls, 2)
+
+    def test_errors_are_raised(self):
+        def fail():
+            raise ValueError("Service unavailable")
+
+        with self.assertRaises(ValueError):
+            self.flights.do("key", fail)
+        self.assertEqual(self.flights.calls, {})
@@ -1,6 +1,7 @@
 from django.test import TestCase
 
 from unittest.mock import patch
+from mangopay.resources import Document
 
 from ..models import MangoPayDocument
 
@@ -36,3 +37,23 @@ class MangoPayDocumentTests(TestCase):
         self.document.ask_for_validation()
         MangoPayDocument.objects.get(id=self.document.id,
                                      status=VALIDATION_ASKED)
+
+
+class MangoPayDocumentSaveChangesTests(TestCase):
+
+    def setUp(self):
+        self.document = MangoPayDocumentFactory(mangopay_id="7", status="VALIDATION_ASKED")
+        self.document = MangoPayDocument.objects.get(id=self.document.id)
+
+    @patch("mangopay2.models.Document.get")
+    def test_unchanged_status_is_not_written(self, get_mock):
+        get_mock.return_value = Document(id="7", status="VALIDATION_ASKED")
+        with self.assertNumQueries(0):
+            self.document.get()
+
+    @patch("mangopay2.models.MangoPayDocument.save")
+    @patch("mangopay2.models.Document.get")
+    def test_only_changed_fields_are_written(self, get_mock, save_mock):
+        get_mock.return_value = Document(id="7", status="VALIDATED")
+        self.document.get()
+        save_mock.assert_called_once_with(update_fields=["status"])
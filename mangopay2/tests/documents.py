@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from django.test import TestCase, SimpleTestCase
+from django.utils.timezone import now
+
+from ..models import VALIDATED, VALIDATION_ASKED
+from ..documents import documents_due, poll_delay, spread_countdowns
+
+from .factories import MangoPayDocumentFactory
+
+
+class DocumentsDueTests(TestCase):
+
+    def setUp(self):
+        self.at = now()
+
+    def document(self, asked, polled=None):
+        return MangoPayDocumentFactory(
+            status=VALIDATION_ASKED, validation_asked_at=self.at - timedelta(hours=asked),
+            polled_at=self.at - timedelta(hours=polled) if polled is not None else None)
+
+    def test_recently_asked_documents_are_not_polled(self):
+        self.document(asked=0.5)
+        self.assertEqual(documents_due(self.at), [])
+
+    def test_never_polled_documents_come_first(self):
+        polled = self.document(asked=30, polled=10)
+        never_polled = self.document(asked=2)
+        self.assertEqual(documents_due(self.at), [never_polled.id, polled.id])
+
+    def test_long_waiting_documents_are_polled_less_often(self):
+        self.document(asked=30, polled=5)
+        recent = self.document(asked=3, polled=1)
+        self.assertEqual(documents_due(self.at), [recent.id])
+
+    def test_limit(self):
+        first = self.document(asked=5)
+        self.document(asked=4)
+        self.assertEqual(documents_due(self.at, limit=1), [first.id])
+
+    def test_other_statuses_are_not_polled(self):
+        MangoPayDocumentFactory(status=VALIDATED, validation_asked_at=self.at - timedelta(days=1))
+        self.assertEqual(documents_due(self.at), [])
+
+
+class SpreadCountdownsTests(SimpleTestCase):
+
+    def test_poll_delay_is_bounded(self):
+        at = now()
+        self.assertEqual(poll_delay(at, at + timedelta(minutes=10)), timedelta(hours=1))
+        self.assertEqual(poll_delay(at, at + timedelta(hours=6)), timedelta(hours=3))
+        self.assertEqual(poll_delay(at, at + timedelta(days=3)), timedelta(hours=8))
+
+    def test_countdowns_are_spread_over_the_interval(self):
+        countdowns = spread_countdowns(4, 3600, 60)
+        self.assertEqual(len(countdowns), 4)
+        for i, countdown in enumerate(countdowns):
+            self.assertTrue(i * 900 <= countdown <= (i + 1) * 900)
+
+    def test_countdowns_are_capped_per_minute(self):
+        self.assertEqual(len(spread_countdowns(1000, 600, 10)), 100)
+        self.assertEqual(spread_countdowns(0, 600, 10), [])
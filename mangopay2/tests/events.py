@@ -0,0 +1,54 @@
+from datetime import date
+
+from django.test import TestCase
+
+from unittest.mock import Mock
+from money import Money
+
+from ..batching import batch_pending_pay_outs
+from ..events import timeline, create_partition_sql, create_partitioned_table_sql, move_to_partition_sql
+from ..models import MangoPayPayOut, MangoPayStatusEvent
+
+from .factories import MangoPayPayOutFactory, MangoPayDocumentFactory
+
+
+class StatusEventTests(TestCase):
+
+    def test_status_changes_are_recorded(self):
+        pay_out = MangoPayPayOutFactory(mangopay_id="1")
+        for status in ["CREATED", "CREATED", "SUCCEEDED"]:
+            pay_out._update(Mock(status=status, creation_date=None))
+        self.assertEqual([event.status for event in timeline(pay_out)], ["CREATED", "SUCCEEDED"])
+        self.assertEqual(set(MangoPayStatusEvent.objects.values_list("kind", flat=True)),
+                         {MangoPayStatusEvent.PAY_OUT})
+
+    def test_other_objects_have_their_own_timeline(self):
+        pay_out = MangoPayPayOutFactory(mangopay_id="1")
+        pay_out._update(Mock(status="CREATED", creation_date=None))
+        self.assertEqual(list(timeline(MangoPayDocumentFactory())), [])
+
+    def test_batched_pay_outs_get_the_status_of_their_batch(self):
+        first = MangoPayPayOutFactory(debited_funds=Money(10, "EUR"), batchable=True)
+        second = MangoPayPayOutFactory(mangopay_user=first.mangopay_user, mangopay_wallet=first.mangopay_wallet,
+                                       mangopay_bank_account=first.mangopay_bank_account,
+                                       debited_funds=Money(20, "EUR"), batchable=True)
+        batch = batch_pending_pay_outs()[0]
+        batch = MangoPayPayOut.objects.get(id=batch.id)
+        batch.mangopay_id = "9"
+        batch.status = "SUCCEEDED"
+        batch.execution_date = None
+        batch._update_batched_pay_outs()
+        self.assertEqual(
+            sorted(MangoPayStatusEvent.objects.values_list("object_id", "status")),
+            [(first.id, "SUCCEEDED"), (second.id, "SUCCEEDED")])
+
+    def test_partition_sql(self):
+        self.assertIn("FOR VALUES FROM ('2026-12-01') TO ('2027-01-01')", create_partition_sql(date(2026, 12, 1)))
+
+    def test_partitioned_table_has_a_default_partition(self):
+        self.assertTrue(create_partitioned_table_sql()[-1].endswith("DEFAULT"))
+
+    def test_events_are_moved_out_of_the_default_partition_before_attaching(self):
+        sql = move_to_partition_sql(date(2026, 12, 1))
+        self.assertTrue(sql[2].startswith('DELETE FROM "mangopay2_mangopaystatusevent_default"'))
+        self.assertIn("ATTACH PARTITION", sql[3])
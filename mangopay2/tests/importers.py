@@ -0,0 +1,57 @@
+from datetime import date
+
+from django.test import TestCase
+
+from unittest.mock import patch
+from mangopay.resources import NaturalUser, LegalUser
+from mangopay.utils import Address
+
+from ..importers import upsert_users, import_users
+from ..models import MangoPayUser, MangoPayNaturalUser, MangoPayImportCheckpoint
+
+from .factories import UserFactory, MangoPayNaturalUserFactory
+
+
+def natural_user(id, email="swede@swedishman.com"):
+    return NaturalUser(id=str(id), email=email, first_name="Sven", last_name="Svensons",
+                       address=Address(address_line_1="Street"), birthday=date(1989, 10, 20),
+                       nationality="SE", country_of_residence="US")
+
+
+class UpsertUsersTests(TestCase):
+
+    def test_creates_users_for_matching_auth_users(self):
+        auth_user = UserFactory(email="sven@example.com")
+        created, updated = upsert_users([natural_user(11, "sven@example.com"), natural_user(12, "none@example.com")])
+        self.assertEqual((created, updated), (1, 0))
+        user = MangoPayNaturalUser.objects.get(mangopay_id=11)
+        self.assertEqual(user.user, auth_user)
+        self.assertEqual(user.address, "Street")
+
+    def test_updates_users_by_mangopay_id(self):
+        MangoPayNaturalUserFactory(mangopay_id=11, occupation="Cobbler")
+        created, updated = upsert_users([natural_user(11)])
+        self.assertEqual((created, updated), (0, 1))
+        user = MangoPayNaturalUser.objects.get(mangopay_id=11)
+        self.assertEqual(user.first_name, "Sven")
+        self.assertIsNone(user.occupation)
+
+    def test_type_mismatch_is_skipped(self):
+        MangoPayNaturalUserFactory(mangopay_id=11)
+        legal_user = LegalUser(id="11", email="hello@fundedbyme.com", name="FundedByMe AB")
+        self.assertEqual(upsert_users([legal_user]), (0, 0))
+
+
+class ImportUsersTests(TestCase):
+
+    @patch("mangopay2.importers.User.all")
+    def test_resumes_from_the_checkpoint(self, all_mock):
+        UserFactory(email="sven@example.com")
+        MangoPayImportCheckpoint.objects.create(name="users", position=3)
+        all_mock.side_effect = [[natural_user(2), natural_user(3, "sven@example.com")], []]
+
+        self.assertEqual(import_users(per_page=2), 4)
+        self.assertEqual(all_mock.call_args_list[0][1], {"page": 2, "per_page": 2, "Sort": "CreationDate:ASC"})
+        self.assertEqual(MangoPayImportCheckpoint.objects.get(name="users").position, 4)
+        self.assertFalse(MangoPayUser.objects.filter(mangopay_id=2).exists())
+        self.assertTrue(MangoPayUser.objects.filter(mangopay_id=3).exists())
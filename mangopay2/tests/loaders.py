@@ -0,0 +1,135 @@
+from django.test import TestCase
+
+from unittest.mock import patch
+from mangopay.resources import Document, BankWirePayOut
+
+from money import Money
+
+from .. import loaders
+from ..models import MangoPayDocument, MangoPayPayOut, CREATED, VALIDATION_ASKED, VALIDATED
+from ..tasks import (
+    create_mangopay_user, update_mangopay_user, create_mangopay_bank_account,
+    create_mangopay_document_and_pages_and_ask_for_validation, update_document_status, create_mangopay_wallet,
+    create_mangopay_pay_out, update_mangopay_pay_out, create_mangopay_transfer, create_mangopay_refund
+)
+
+from .factories import (
+    MangoPayNaturalUserFactory, MangoPayIBANBankAccountFactory, MangoPayDocumentFactory, MangoPayWalletFactory,
+    MangoPayPayOutFactory, MangoPayTransferFactory, MangoPayInRefundFactory
+)
+
+
+def remote_save(status=None):
+    # Stands for the API creating or updating the entity, which sends back
+    # the creation date even for the resources not declaring it
+    def save(entity):
+        entity.id = "9"
+        entity.creation_date = None
+        if status is not None and getattr(entity, "status", None) is None:
+            entity.status = status
+    return save
+
+
+class LoaderQueryCountTests(TestCase):
+    """
+    Each task loads its row through a loader and then builds the SDK
+    entities; none of that should hit the database lazily. The queries
+    left are the load and the writes of what the API sent back.
+    """
+
+    @patch("mangopay2.models.NaturalUser.save", autospec=True, side_effect=remote_save())
+    def test_create_mangopay_user(self, save):
+        user = MangoPayNaturalUserFactory()
+        # Load, write the remote id
+        with self.assertNumQueries(2):
+            create_mangopay_user.run(id=user.id)
+        save.assert_called_once()
+
+    @patch("mangopay2.models.NaturalUser.save", autospec=True, side_effect=remote_save())
+    def test_update_mangopay_user(self, save):
+        user = MangoPayNaturalUserFactory(mangopay_id="1")
+        with self.assertNumQueries(1):
+            update_mangopay_user.run(id=user.id)
+        save.assert_called_once()
+
+    @patch("mangopay2.models.BankAccount.save", autospec=True, side_effect=remote_save())
+    def test_create_mangopay_bank_account(self, save):
+        bank_account = MangoPayIBANBankAccountFactory()
+        # Load, write the remote id
+        with self.assertNumQueries(2):
+            create_mangopay_bank_account.run(id=bank_account.id)
+        save.assert_called_once()
+
+    @patch("mangopay2.models.Document.save", autospec=True, side_effect=remote_save(CREATED))
+    def test_create_mangopay_document_and_pages_and_ask_for_validation(self, save):
+        document = MangoPayDocumentFactory()
+        # Load with the pages, then for the creation and for the validation
+        # asked for, write the changes and their status event
+        with self.assertNumQueries(6):
+            create_mangopay_document_and_pages_and_ask_for_validation.run(id=document.id)
+        self.assertEqual(MangoPayDocument.objects.get(id=document.id).status, VALIDATION_ASKED)
+        self.assertEqual(save.call_count, 2)
+
+    @patch("mangopay2.models.Document.get", return_value=Document(id="9", status=VALIDATED))
+    def test_update_document_status(self, get):
+        document = MangoPayDocumentFactory(mangopay_id="9", status=VALIDATION_ASKED)
+        # Load, write the status and its event
+        with self.assertNumQueries(3):
+            update_document_status.run(id=document.id)
+        self.assertEqual(MangoPayDocument.objects.get(id=document.id).status, VALIDATED)
+
+    @patch("mangopay2.models.Wallet.save", autospec=True, side_effect=remote_save())
+    def test_create_mangopay_wallet(self, save):
+        wallet = MangoPayWalletFactory()
+        # Load, write the remote id
+        with self.assertNumQueries(2):
+            create_mangopay_wallet.run(id=wallet.id)
+        save.assert_called_once()
+
+    @patch("mangopay2.tasks.update_mangopay_pay_out.apply_async")
+    @patch("mangopay2.models.BankWirePayOut.save", autospec=True, side_effect=remote_save("CREATED"))
+    def test_create_mangopay_pay_out(self, save, apply_async):
+        pay_out = MangoPayPayOutFactory(mangopay_bank_account=MangoPayIBANBankAccountFactory(),
+                                        debited_funds=Money(100, "EUR"),
+                                        fees=Money(10, "EUR"))
+        # Load, write the changes and their status event, then find and
+        # update the payouts batched into it
+        with self.assertNumQueries(5):
+            create_mangopay_pay_out.run(id=pay_out.id)
+        self.assertEqual(MangoPayPayOut.objects.get(id=pay_out.id).mangopay_id, "9")
+        apply_async.assert_called_once()
+
+    @patch("mangopay2.tasks.update_mangopay_pay_out.apply_async")
+    @patch("mangopay2.models.BankWirePayOut.get",
+           return_value=BankWirePayOut(id="9", status="CREATED", creation_date=None))
+    def test_update_mangopay_pay_out(self, get, apply_async):
+        pay_out = MangoPayPayOutFactory(mangopay_id="9", mangopay_bank_account=MangoPayIBANBankAccountFactory())
+        # Load, look for a stored payload, write the status and its event,
+        # then find and update the payouts batched into it
+        with self.assertNumQueries(6):
+            update_mangopay_pay_out.run(id=pay_out.id)
+        self.assertEqual(MangoPayPayOut.objects.get(id=pay_out.id).status, "CREATED")
+        apply_async.assert_called_once()
+
+    @patch("mangopay2.models.Transfer.save", autospec=True, side_effect=remote_save("SUCCEEDED"))
+    def test_create_mangopay_transfer(self, save):
+        transfer = MangoPayTransferFactory()
+        # Load, write the changes and their status event
+        with self.assertNumQueries(3):
+            create_mangopay_transfer.run(transfer_id=transfer.id)
+        save.assert_called_once()
+
+    @patch("mangopay2.models.PayInRefund.save", autospec=True, side_effect=remote_save("SUCCEEDED"))
+    def test_create_mangopay_refund(self, save):
+        refund = MangoPayInRefundFactory(mangopay_pay_in__mangopay_id="8")
+        # Load, write the changes and their status event
+        with self.assertNumQueries(3):
+            create_mangopay_refund.run(id=refund.id)
+        self.assertEqual(save.call_args[0][0].payin_id, "8")
+
+    def test_related_entities_are_sent_by_id(self):
+        transfer = MangoPayTransferFactory(mangopay_debited_wallet__mangopay_id=3,
+                                           mangopay_credited_wallet__mangopay_id=4)
+        transfer = loaders.transfers().get(id=transfer.id).get_transfer()
+        self.assertEqual(transfer.debited_wallet_id, "3")
+        self.assertEqual(transfer.credited_wallet_id, "4")
@@ -0,0 +1,41 @@
+from django.test import TestCase, override_settings
+
+from ..locks import wallet_lock, WalletLockTimeout
+from ..signals import wallet_lock_acquired
+
+
+@override_settings(MANGOPAY_WALLET_LOCK_WAIT=0.1)
+class WalletLockTests(TestCase):
+
+    def test_same_wallet_is_locked(self):
+        with wallet_lock(1):
+            with self.assertRaises(WalletLockTimeout):
+                with wallet_lock(1):
+                    pass
+
+    def test_other_wallets_are_not_locked(self):
+        with wallet_lock(1):
+            with wallet_lock(2):
+                pass
+
+    def test_lock_is_released(self):
+        with wallet_lock(1):
+            pass
+        with wallet_lock(1):
+            pass
+
+    def test_wait_time_is_sent(self):
+        received = []
+
+        def receiver(sender, wallet_id, waited, **kwargs):
+            received.append((wallet_id, waited))
+
+        wallet_lock_acquired.connect(receiver)
+        try:
+            with wallet_lock(3):
+                pass
+        finally:
+            wallet_lock_acquired.disconnect(receiver)
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0][0], 3)
+        self.assertGreaterEqual(received[0][1], 0)
@@ -0,0 +1,35 @@
+from django.test import TestCase
+
+from unittest.mock import Mock
+
+from ..models import MangoPayOutboxEntry
+from ..outbox import enqueue, relay_outbox
+
+
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        self.task = Mock()
+        self.task.name = "mangopay2.tasks.create_mangopay_wallet"
+        self.tasks = {self.task.name: self.task}
+
+    def test_entries_are_sent_in_order_and_deleted(self):
+        enqueue(self.task, id=1, description="first")
+        enqueue(self.task, id=2, description="second")
+        self.assertEqual(relay_outbox(self.tasks), 2)
+        self.assertEqual([call[1]["kwargs"]["id"] for call in self.task.apply_async.call_args_list], [1, 2])
+        self.assertFalse(MangoPayOutboxEntry.objects.exists())
+
+    def test_batches(self):
+        for id in range(3):
+            enqueue(self.task, id=id)
+        self.assertEqual(relay_outbox(self.tasks, batch_size=2), 2)
+        self.assertEqual(MangoPayOutboxEntry.objects.count(), 1)
+
+    def test_entries_left_after_a_publish_failure(self):
+        enqueue(self.task, id=1)
+        enqueue(self.task, id=2)
+        self.task.apply_async.side_effect = [None, ConnectionError("Broker unavailable")]
+        with self.assertRaises(ConnectionError):
+            relay_outbox(self.tasks)
+        self.assertEqual([entry.kwargs for entry in MangoPayOutboxEntry.objects.all()], [{"id": 2}])
@@ -1,9 +1,16 @@
+import base64
+import hashlib
 import os
+from importlib.util import find_spec
+from io import BytesIO
+from unittest import skipUnless
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from unittest.mock import patch
 
+from ..models import page_storage, PAGE_READ_CHUNK_SIZE, REFUSED, RefusedPageError
+from ..pages import InvalidPageError
 from .factories import MangoPayPageFactory
 from .client import MockMangoPayApi
 
@@ -18,3 +25,127 @@ class MangoPayPageTests(TestCase):
         mock_client.return_value = MockMangoPayApi()
         self.page.file = 'file:///{}/{}'.format(os.getcwd(), "mangopay/tests/test.png")
         self.page.create()
+
+
+class MangoPayPageStorageTests(TestCase):
+
+    def setUp(self):
+        self.page = MangoPayPageFactory(storage_path="mangopay_pages/scan.png")
+
+    @patch("mangopay2.models.urlopen")
+    @patch("mangopay2.models.page_storage")
+    def test_file_is_read_from_the_storage(self, page_storage_mock, urlopen_mock):
+        content = b"%PDF-" + b"x" * PAGE_READ_CHUNK_SIZE
+        page_storage_mock.return_value.open.return_value = BytesIO(content)
+        self.assertEqual(self.page._file_bytes(), base64.b64encode(content))
+        page_storage_mock.return_value.open.assert_called_once_with("mangopay_pages/scan.png", "rb")
+        urlopen_mock.assert_not_called()
+
+    @override_settings(MANGOPAY_PAGE_DEFAULT_STORAGE=True)
+    def test_storage_is_built_once(self):
+        self.assertIs(page_storage(), page_storage())
+
+
+@patch("mangopay2.models.page_storage")
+class MangoPayPagePreflightTests(TestCase):
+
+    def setUp(self):
+        self.page = MangoPayPageFactory(storage_path="mangopay_pages/scan")
+
+    def read(self, page_storage_mock, content, size=None):
+        source = BytesIO(content)
+        source.size = size
+        page_storage_mock.return_value.open.return_value = source
+        return self.page._read()
+
+    def test_unsupported_format(self, page_storage_mock):
+        with self.assertRaises(InvalidPageError):
+            self.read(page_storage_mock, b"PK\x03\x04" + b"x" * 40000)
+
+    def test_too_small(self, page_storage_mock):
+        with self.assertRaises(InvalidPageError):
+            self.read(page_storage_mock, b"%PDF-1.4")
+
+    @override_settings(MANGOPAY_PAGE_MAX_SIZE=40000)
+    def test_declared_size_over_the_limit(self, page_storage_mock):
+        with self.assertRaises(InvalidPageError):
+            self.read(page_storage_mock, b"%PDF-" + b"x" * 35000, size=10 ** 7)
+
+    @override_settings(MANGOPAY_PAGE_MAX_SIZE=40000)
+    def test_read_size_over_the_limit(self, page_storage_mock):
+        with self.assertRaises(InvalidPageError):
+            self.read(page_storage_mock, b"%PDF-" + b"x" * 45000)
+
+    def test_valid_page(self, page_storage_mock):
+        content = b"%PDF-" + b"x" * 35000
+        encoded, content_hash, size = self.read(page_storage_mock, content, size=len(content))
+        self.assertEqual((encoded, size), (base64.b64encode(content), len(content)))
+
+
+@patch("mangopay2.models.Page.save")
+@patch("mangopay2.models.MangoPayPage._read", return_value=(b"eA==", "a" * 64, 1))
+class MangoPayPageDeduplicationTests(TestCase):
+
+    def setUp(self):
+        self.page = MangoPayPageFactory(document__mangopay_id="1")
+
+    def test_page_is_sent_and_hashed(self, read_mock, save_mock):
+        self.assertTrue(self.page.create())
+        save_mock.assert_called_once()
+        self.page.refresh_from_db()
+        self.assertEqual((self.page.content_hash, self.page.size), ("a" * 64, 1))
+
+    def test_same_bytes_are_not_sent_twice_for_a_document(self, read_mock, save_mock):
+        MangoPayPageFactory(document=self.page.document, content_hash="a" * 64, size=1)
+        self.assertFalse(self.page.create())
+        save_mock.assert_not_called()
+
+    def test_bytes_of_a_refused_page_are_not_sent_again(self, read_mock, save_mock):
+        document = self.page.document
+        MangoPayPageFactory(document__mangopay_user=document.mangopay_user, document__type=document.type,
+                            document__status=REFUSED, content_hash="a" * 64, size=1)
+        with self.assertRaises(RefusedPageError):
+            self.page.create()
+        save_mock.assert_not_called()
+
+
+@skipUnless(find_spec("PIL"), "Pillow is not installed")
+@override_settings(MANGOPAY_PAGE_OPTIMIZE_IMAGES=True, MANGOPAY_PAGE_MIN_SIZE=0, MANGOPAY_PAGE_MAX_SIZE=1000000,
+                   MANGOPAY_PAGE_MAX_DIMENSION=400)
+@patch("mangopay2.models.page_storage")
+class MangoPayPageOptimizationTests(TestCase):
+
+    def setUp(self):
+        self.page = MangoPayPageFactory(storage_path="mangopay_pages/scan.png")
+
+    def read(self, page_storage_mock, content, size=None):
+        source = BytesIO(content)
+        source.size = size
+        page_storage_mock.return_value.open.return_value = source
+        return self.page._read()
+
+    def noise(self):
+        # Random pixels barely compress, so the PNG is over the size limit
+        from PIL import Image
+
+        output = BytesIO()
+        Image.frombytes("RGB", (800, 800), os.urandom(800 * 800 * 3)).save(output, "PNG")
+        return output.getvalue()
+
+    def test_oversized_images_are_recompressed(self, page_storage_mock):
+        content = self.noise()
+        encoded, content_hash, size = self.read(page_storage_mock, content)
+        data = base64.b64decode(encoded)
+        self.assertTrue(data.startswith(b"\xff\xd8\xff"))
+        self.assertEqual(size, len(data))
+        self.assertLessEqual(size, 1000000)
+        self.assertEqual(content_hash, hashlib.sha256(content).hexdigest())
+
+    @override_settings(MANGOPAY_PAGE_MAX_SIZE=10000, MANGOPAY_PAGE_MAX_SOURCE_SIZE=5000000)
+    def test_images_over_the_limit_at_the_lowest_quality(self, page_storage_mock):
+        with self.assertRaisesMessage(InvalidPageError, "at the lowest quality"):
+            self.read(page_storage_mock, self.noise())
+
+    def test_images_over_the_source_limit_are_not_read(self, page_storage_mock):
+        with self.assertRaises(InvalidPageError):
+            self.read(page_storage_mock, b"\x89PNG\r\n\x1a\n" + b"x" * 100, size=10 ** 9)
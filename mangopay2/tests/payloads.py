@@ -0,0 +1,30 @@
+from django.test import TestCase
+
+from unittest.mock import patch
+from mangopay.resources import BankWirePayOut
+
+from ..models import MangoPayTransactionPayload, fetch_transaction
+
+
+@patch("mangopay2.models.BankWirePayOut.get")
+class FetchTransactionTests(TestCase):
+
+    def remote_pay_out(self, status):
+        return BankWirePayOut(id="7", author_id="3", debited_wallet_id="5", status=status, result_code="000000")
+
+    def test_final_transactions_are_fetched_once(self, get_mock):
+        get_mock.return_value = self.remote_pay_out("SUCCEEDED")
+        fetch_transaction(BankWirePayOut, "7")
+        pay_out = fetch_transaction(BankWirePayOut, "7")
+
+        get_mock.assert_called_once_with("7")
+        self.assertIsInstance(pay_out, BankWirePayOut)
+        self.assertEqual((pay_out.get_pk(), pay_out.status, pay_out.author_id), ("7", "SUCCEEDED", "3"))
+
+    def test_pending_transactions_are_not_stored(self, get_mock):
+        get_mock.return_value = self.remote_pay_out("CREATED")
+        fetch_transaction(BankWirePayOut, "7")
+        fetch_transaction(BankWirePayOut, "7")
+
+        self.assertEqual(get_mock.call_count, 2)
+        self.assertFalse(MangoPayTransactionPayload.objects.exists())
@@ -2,9 +2,13 @@ from django.test import TestCase
 
 from unittest.mock import patch
 
+from money import Money
+
+from .. import loaders
 from ..models import MangoPayInRefund
+from ..refunds import create_refunds, partition
 
-from .factories import MangoPayInRefundFactory
+from .factories import MangoPayInRefundFactory, MangoPayPayInFactory, MangoPayWalletFactory
 from .client import MockMangoPayApi
 
 
@@ -20,3 +24,39 @@ class MangoPayRefundTests(TestCase):
         self.assertIsNone(self.refund.mangopay_id)
         self.refund.create()
         MangoPayInRefund.objects.get(id=self.refund.id, mangopay_id=id)
+
+    def test_get_refund_uses_the_stored_ids(self):
+        refund = loaders.refunds().get(id=self.refund.id)
+        with self.assertNumQueries(0):
+            payin_refund = refund.get_refund()
+        self.assertEqual(payin_refund.author_id, self.refund.mangopay_user.mangopay_id)
+        self.assertEqual(payin_refund.payin_id, "2")
+        self.assertIsNone(payin_refund.debited_funds)
+
+    def test_get_partial_refund(self):
+        self.refund.debited_funds = Money(10, "EUR")
+        payin_refund = self.refund.get_refund()
+        self.assertEqual(payin_refund.debited_funds.amount, 1000)
+        self.assertEqual(payin_refund.fees.amount, 0)
+
+
+class RefundPayInsTests(TestCase):
+
+    def test_create_refunds_groups_by_wallet(self):
+        wallet = MangoPayWalletFactory()
+        pay_ins = [MangoPayPayInFactory(mangopay_id=i, status="SUCCEEDED", mangopay_wallet=wallet)
+                   for i in range(1, 3)]
+        other = MangoPayPayInFactory(mangopay_id=3, status="SUCCEEDED")
+        failed = MangoPayPayInFactory(mangopay_id=4, status="FAILED")
+        groups = create_refunds([p.id for p in pay_ins] + [other.id, failed.id])
+        self.assertEqual(sorted(len(ids) for ids in groups), [1, 2])
+        self.assertFalse(MangoPayInRefund.objects.filter(mangopay_pay_in=failed).exists())
+
+    def test_pay_ins_are_refunded_once(self):
+        pay_in = MangoPayPayInFactory(mangopay_id=1, status="SUCCEEDED")
+        create_refunds([pay_in.id])
+        self.assertEqual(create_refunds([pay_in.id]), [])
+
+    def test_partition(self):
+        self.assertEqual(partition([[1], [2, 3], [4]], 2), [[2, 3], [1, 4]])
+        self.assertEqual(partition([[1]], 4), [[1]])
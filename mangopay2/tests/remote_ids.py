@@ -0,0 +1,18 @@
+from django.apps import apps
+from django.test import TestCase
+
+from ..models import MangoPayUser, MangoPayPayOut
+from ..remote_ids import remote_id_models, STRING_REMOTE_ID_MODELS
+
+
+class RemoteIdModelsTests(TestCase):
+
+    def test_every_mangopay_id_column_is_migrated(self):
+        models = set(
+            model for model in apps.get_app_config("mangopay2").get_models()
+            if "mangopay_id" in [field.name for field in model._meta.local_fields])
+        self.assertEqual(set(remote_id_models()), models - set(STRING_REMOTE_ID_MODELS))
+
+    def test_remote_ids_are_strings(self):
+        self.assertEqual(MangoPayUser._meta.get_field("mangopay_id").get_internal_type(), "CharField")
+        self.assertFalse(MangoPayPayOut._meta.get_field("mangopay_id").unique)
@@ -0,0 +1,18 @@
+from django.test import TestCase, override_settings
+
+from ..routing import task_queue, task_priority, task_queues, INTERACTIVE_QUEUE, BULK_QUEUE
+
+
+class TaskRoutingTests(TestCase):
+
+    def test_defaults(self):
+        self.assertEqual(task_queue("create_mangopay_user"), INTERACTIVE_QUEUE)
+        self.assertEqual(task_queue("UpdateDocumentsStatus"), BULK_QUEUE)
+        self.assertGreater(task_priority("create_mangopay_user"), task_priority("update_document_status"))
+
+    @override_settings(MANGOPAY_TASK_QUEUES={"update_document_status": "kyc"},
+                       MANGOPAY_QUEUE_PRIORITIES={"kyc": 5})
+    def test_settings_override_the_defaults(self):
+        self.assertEqual(task_queue("update_document_status"), "kyc")
+        self.assertEqual(task_priority("update_document_status"), 5)
+        self.assertIn("kyc", [queue.name for queue in task_queues()])
@@ -1 +1,6 @@
-urlpatterns = []
\ No newline at end of file
+from django.conf.urls import url
+from django.contrib import admin
+
+urlpatterns = [
+    url(r"^admin/", admin.site.urls),
+]
@@ -45,12 +45,30 @@ def main():
                          "paypaladaptive/templates"),
         ),
         "INSTALLED_APPS": (
+            "django.contrib.admin",
             "django.contrib.auth",
             "django.contrib.contenttypes",
+            "django.contrib.messages",
             "django.contrib.sessions",
             "django.contrib.sites",
             app_name,
         ),
+        "MIDDLEWARE": (
+            "django.contrib.sessions.middleware.SessionMiddleware",
+            "django.contrib.auth.middleware.AuthenticationMiddleware",
+            "django.contrib.messages.middleware.MessageMiddleware",
+        ),
+        "TEMPLATES": [{
+            "BACKEND": "django.template.backends.django.DjangoTemplates",
+            "APP_DIRS": True,
+            "OPTIONS": {
+                "context_processors": [
+                    "django.template.context_processors.request",
+                    "django.contrib.auth.context_processors.auth",
+                    "django.contrib.messages.context_processors.messages",
+                ],
+            },
+        }],
         "MANGOPAY_PAGE_DEFAULT_STORAGE": True,
         "LOGGING": {
             'version': 1,